@@ -5,3 +5,6 @@ from django.apps import AppConfig
 
 class CasearchConfig(AppConfig):
     name = 'casearch'
+
+    def ready(self):
+        from casearch import receivers  # noqa
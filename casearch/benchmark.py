@@ -0,0 +1,225 @@
+"""
+Synthetic catalogues and the search/listing measurements run against
+them by the casearch_benchmark command.
+"""
+import gc
+import random
+import resource
+import time
+from decimal import Decimal
+from itertools import product as combinations
+
+import factory
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.core.signals import request_started
+from django.db import connection, reset_queries
+from django.http import QueryDict
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import urlencode
+from django.utils.text import slugify
+from oscar.core.loading import get_class, get_model
+
+from casearch.facets import FACET_BITMAPS_CACHE_KEY
+from casearch.models import ProductSearchRecord
+from casearch.pricebuckets import PRICE_BOUNDARIES_CACHE_KEY, PRICE_BUCKETS_CACHE_KEY
+from casearch.resultcache import bump_catalogue_version, result_cache
+
+Category = get_model('catalogue', 'Category')
+Partner = get_model('partner', 'Partner')
+Product = get_model('catalogue', 'Product')
+ProductAttribute = get_model('catalogue', 'ProductAttribute')
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+ProductCategory = get_model('catalogue', 'ProductCategory')
+ProductClass = get_model('catalogue', 'ProductClass')
+StockRecord = get_model('partner', 'StockRecord')
+
+GRADES = ('A', 'B', 'C', 'D')
+CARRIERS = ('AT&T', 'Sprint', 'T-Mobile', 'Unlocked', 'Verizon')
+BRANDS = ('Apple iPhone', 'Samsung Galaxy', 'LG', 'Motorola Moto', 'Google Pixel', 'HTC One')
+# rows built and inserted at a time, keeps memory flat for large catalogues.
+CHUNK_SIZE = 5000
+
+
+class ProductFactory(factory.django.DjangoModelFactory):
+    title = factory.LazyAttribute(
+        lambda o: '%s %s %s' % (random.choice(BRANDS), o.model_name, o.colour))
+    slug = factory.LazyAttribute(lambda o: slugify(o.title))
+    description = factory.Faker('paragraph')
+    structure = Product.STANDALONE
+
+    class Meta:
+        model = Product
+        exclude = ('model_name', 'colour')
+
+    model_name = factory.Faker('word')
+    colour = factory.Faker('safe_color_name')
+
+
+class StockRecordFactory(factory.django.DjangoModelFactory):
+    partner_sku = factory.Sequence(lambda n: 'BENCH-%d' % n)
+    price_currency = 'USD'
+    price_excl_tax = factory.LazyFunction(
+        lambda: Decimal(random.randint(2000, 90000)) / 100)
+    num_in_stock = factory.LazyFunction(lambda: random.randint(0, 50))
+
+    class Meta:
+        model = StockRecord
+
+
+class Catalogue(object):
+    """
+    Grows a synthetic catalogue of phones with a grade, a carrier and a
+    stock record each, half of them in one category.
+
+    Rows are inserted with bulk_create, bypassing the signal receivers,
+    so the search records are written here too.
+    """
+
+    def __init__(self):
+        self.product_class, __ = ProductClass.objects.get_or_create(
+            name='Benchmark phone', defaults={'track_stock': True})
+        self.attributes = dict(
+            (code, ProductAttribute.objects.get_or_create(
+                product_class=self.product_class, code=code,
+                defaults={'name': code.title(), 'type': ProductAttribute.TEXT})[0])
+            for code in ('grade', 'carrier'))
+        self.partner, __ = Partner.objects.get_or_create(name='Benchmark partner')
+        self.category = Category.add_root(name='Benchmark phones')
+        self.size = 0
+
+    def grow(self, size):
+        while self.size < size:
+            count = min(CHUNK_SIZE, size - self.size)
+            self.add_products(count)
+            self.size += count
+        # nothing cached from the smaller catalogue may be reused.
+        bump_catalogue_version()
+        result_cache.clear()
+        cache.delete_many([
+            FACET_BITMAPS_CACHE_KEY, PRICE_BUCKETS_CACHE_KEY, PRICE_BOUNDARIES_CACHE_KEY,
+            get_class('search.utils', 'FACET_CHOICES_CACHE_KEY')])
+
+    def add_products(self, count):
+        products = ProductFactory.build_batch(count, product_class=self.product_class)
+        # ids are set on the instances by postgres.
+        products = Product.objects.bulk_create(products)
+        stockrecords = StockRecord.objects.bulk_create([
+            StockRecordFactory.build(product=p, partner=self.partner) for p in products])
+        grades = [random.choice(GRADES) for p in products]
+        carriers = [random.choice(CARRIERS) for p in products]
+        ProductAttributeValue.objects.bulk_create(
+            [ProductAttributeValue(
+                product=p, attribute=self.attributes['grade'], value_text=grade)
+             for p, grade in zip(products, grades)] +
+            [ProductAttributeValue(
+                product=p, attribute=self.attributes['carrier'], value_text=carrier)
+             for p, carrier in zip(products, carriers)])
+        ProductCategory.objects.bulk_create([
+            ProductCategory(product=p, category=self.category) for p in products[::2]])
+        ProductSearchRecord.objects.bulk_create([
+            ProductSearchRecord(
+                product=p, price_excl_tax=s.price_excl_tax, price_currency=s.price_currency,
+                grades=[grade], carriers=[carrier])
+            for p, s, grade, carrier in zip(products, stockrecords, grades, carriers)])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE casearch_productsearchrecord r "
+                "SET search_vector = to_tsvector('simple', p.title || ' ' || p.description) "
+                "FROM catalogue_product p "
+                "WHERE p.id = r.product_id AND p.id >= %s",
+                [products[0].pk])
+
+
+def get_matrix():
+    """
+    Return the (filters, sort_by) combinations to measure.
+    """
+    filters = [
+        {},
+        {'q': 'galaxy'},
+        {'grade': ['A']},
+        {'grade': ['A', 'B'], 'carrier': ['Verizon']},
+        {'min_price': 100, 'max_price': 300},
+        {'q': 'samsung', 'grade': ['A'], 'min_price': 100},
+    ]
+    sorts = [None, 'price', '-price', 'title']
+    return list(combinations(filters, sorts))
+
+
+def peak_memory_kb():
+    # ru_maxrss is in kilobytes on linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(func, repeat):
+    """
+    Call func repeat times and return its cold and warm latencies in ms,
+    the queries of the warm calls and the growth of the peak memory.
+    """
+    gc.collect()
+    memory = peak_memory_kb()
+    timings = []
+    queries = 0
+    # requests clear the recorded queries as they start.
+    request_started.disconnect(reset_queries)
+    try:
+        for i in range(repeat):
+            # the log is capped, start each call from an empty one.
+            reset_queries()
+            with CaptureQueriesContext(connection) as context:
+                start = time.time()
+                func()
+                timings.append((time.time() - start) * 1000)
+            queries = len(context.captured_queries)
+    finally:
+        request_started.connect(reset_queries)
+    warm = sorted(timings[1:] or timings)
+    return {
+        'cold_ms': round(timings[0], 2),
+        'median_ms': round(warm[len(warm) // 2], 2),
+        'min_ms': round(warm[0], 2),
+        'queries': queries,
+        'peak_memory_growth_kb': peak_memory_kb() - memory,
+    }
+
+
+def run_benchmarks(catalogue, repeat):
+    """
+    Measure the listings and the search form against the catalogue in
+    its current size, returning a result per target and parameters.
+    """
+    client = Client()
+    SearchForm = get_class('search.forms', 'SearchForm')
+    targets = [
+        ('casearch.IndexView', reverse('casearch:index')),
+        ('CatalogueView', reverse('catalogue:index')),
+        ('ProductCategoryView', catalogue.category.get_absolute_url()),
+    ]
+    results = []
+
+    def get(url):
+        def request():
+            response = client.get(url)
+            assert response.status_code == 200, '%s returned %s' % (url, response.status_code)
+        return request
+
+    for filters, sort_by in get_matrix():
+        params = dict(filters)
+        if sort_by:
+            params['sort_by'] = sort_by
+        query_string = urlencode(params, doseq=True)
+        for name, path in targets:
+            result_cache.clear()
+            results.append(dict(
+                target=name, size=catalogue.size, params=params,
+                **measure(get('%s?%s' % (path, query_string)), repeat)))
+
+    def build_form():
+        SearchForm(QueryDict('grade=A&carrier=Verizon'))
+
+    cache.delete(get_class('search.utils', 'FACET_CHOICES_CACHE_KEY'))
+    results.append(dict(
+        target='SearchForm', size=catalogue.size, params={}, **measure(build_form, repeat)))
+    return results
@@ -0,0 +1,88 @@
+import binascii
+
+
+class Bitmap(object):
+    """
+    Set of small non-negative integers, eg. document numbers, held as the
+    bits of a single long so set operations run in C.
+
+    Serialized little-endian: bit i is bit (i & 7) of byte (i >> 3).
+    """
+    __slots__ = ('bits',)
+
+    def __init__(self, bits=0):
+        self.bits = bits
+
+    @classmethod
+    def from_ids(cls, ids):
+        ids = list(ids)
+        if not ids:
+            return cls()
+        data = bytearray((max(ids) >> 3) + 1)
+        for i in ids:
+            data[i >> 3] |= 1 << (i & 7)
+        return cls.from_bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytearray(data)
+        if not data:
+            return cls()
+        data.reverse()
+        return cls(int(binascii.hexlify(bytes(data)), 16))
+
+    @classmethod
+    def full(cls, size):
+        """
+        Return the bitmap of all the integers below size.
+        """
+        return cls((1 << size) - 1)
+
+    def to_bytes(self, length=None):
+        hexed = '%x' % self.bits
+        if length is None:
+            length = (len(hexed) + 1) // 2
+        data = bytearray(binascii.unhexlify(hexed.zfill(length * 2)))
+        data.reverse()
+        return bytes(data)
+
+    def __and__(self, other):
+        return Bitmap(self.bits & other.bits)
+
+    def __or__(self, other):
+        return Bitmap(self.bits | other.bits)
+
+    def __sub__(self, other):
+        return Bitmap(self.bits & ~other.bits)
+
+    def __eq__(self, other):
+        return isinstance(other, Bitmap) and self.bits == other.bits
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __contains__(self, i):
+        return bool(self.bits >> i & 1)
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+    def __nonzero__(self):
+        return bool(self.bits)
+
+    __bool__ = __nonzero__
+
+    def __iter__(self):
+        """
+        Iterate over the integers in ascending order.
+        """
+        if not self.bits:
+            return
+        for byte_index, byte in enumerate(bytearray(self.to_bytes())):
+            if byte:
+                for bit in range(8):
+                    if byte >> bit & 1:
+                        yield (byte_index << 3) + bit
+
+    def __repr__(self):
+        return 'Bitmap(%d items)' % len(self)
@@ -0,0 +1,124 @@
+"""
+Catalogue export for wholesale buyers: every browsable product with its
+price, availability, grade and carrier, read in chunks through a server
+side cursor so memory stays flat however big the catalogue is.
+"""
+import json
+import uuid
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.models import Q
+from oscar.core.loading import get_model
+
+Product = get_model('catalogue', 'Product')
+StockRecord = get_model('partner', 'StockRecord')
+
+EXPORT_FIELDS = (
+    'pk', 'upc', 'title', 'slug', 'date_updated', 'product_class__track_stock',
+    'search_record__price_excl_tax', 'search_record__price_currency',
+    'search_record__grades', 'search_record__carriers', 'search_record__date_updated',
+)
+
+
+def get_chunk_size():
+    return getattr(settings, 'CASEARCH_EXPORT_CHUNK_SIZE', 2000)
+
+
+def get_export_queryset(updated_since=None):
+    products = Product.browsable.order_by('pk')
+    if updated_since is not None:
+        # price, stock and attribute changes touch the search record, not
+        # the product.
+        products = products.filter(
+            Q(date_updated__gte=updated_since) | Q(search_record__date_updated__gte=updated_since))
+    return products.values_list(*EXPORT_FIELDS)
+
+
+def iter_rows(queryset, chunk_size):
+    """
+    Yield lists of up to chunk_size rows of a values_list queryset, read
+    with a named (server side) cursor.
+    """
+    sql, params = queryset.query.sql_with_params()
+    connection.ensure_connection()
+    # outside a transaction the cursor must be held past the implicit commit.
+    cursor = connection.connection.cursor(
+        name='casearch_export_%s' % uuid.uuid4().hex,
+        withhold=connection.get_autocommit())
+    try:
+        cursor.itersize = chunk_size
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def get_stock(product_ids):
+    """
+    Return a dict of product id to net stock level of the stock record the
+    strategy picks (the first one), children adding up to their parent.
+    """
+    stock = {}
+    seen = set()
+    stockrecords = StockRecord.objects.filter(
+        Q(product_id__in=product_ids) | Q(product__parent_id__in=product_ids)
+    ).order_by('pk').values_list('product_id', 'product__parent_id', 'num_in_stock', 'num_allocated')
+    for product_id, parent_id, num_in_stock, num_allocated in stockrecords:
+        if product_id in seen:
+            continue
+        seen.add(product_id)
+        net = (num_in_stock or 0) - (num_allocated or 0)
+        key = parent_id if parent_id in product_ids else product_id
+        stock[key] = stock.get(key, 0) + net
+    return stock
+
+
+def iter_records(updated_since=None, chunk_size=None):
+    """
+    Yield a dict per browsable product, in id order, optionally only for
+    the ones changed since updated_since. Deleted products are not
+    reported.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    for rows in iter_rows(get_export_queryset(updated_since), chunk_size):
+        stock = get_stock(set(row[0] for row in rows))
+        for (pk, upc, title, slug, date_updated, track_stock, price, currency,
+                grades, carriers, record_updated) in rows:
+            num_in_stock = stock.get(pk)
+            yield {
+                'id': pk,
+                'upc': upc,
+                'title': title,
+                'url': reverse('catalogue:detail', kwargs={'product_slug': slug, 'pk': pk}),
+                'price': price,
+                'currency': currency or None,
+                'num_in_stock': num_in_stock,
+                # as the StockRequired policy decides it.
+                'is_available': num_in_stock is not None and (
+                    not track_stock or num_in_stock > 0),
+                'grade': ', '.join(grades or ()) or None,
+                'carrier': ', '.join(carriers or ()) or None,
+                'date_updated': max(d for d in (date_updated, record_updated) if d is not None),
+            }
+
+
+def iter_ndjson(updated_since=None, chunk_size=None):
+    """
+    Yield the export as newline delimited json, a product per line, a
+    hundred lines at a time.
+    """
+    lines = []
+    for record in iter_records(updated_since, chunk_size):
+        lines.append(json.dumps(record, cls=DjangoJSONEncoder))
+        if len(lines) == 100:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
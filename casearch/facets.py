@@ -0,0 +1,134 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from oscar.core.loading import get_class, get_model
+
+from casearch.bitmaps import Bitmap
+from casearch.pricebuckets import count_price_buckets
+from casearch.resultcache import get_catalogue_version
+from casearch.utils import normalize_search_params
+
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+
+FACET_BITMAPS_CACHE_KEY = 'casearch.facet_bitmaps'
+FACET_COUNTS_CACHE_KEY = 'casearch.facet_counts.%s'
+
+
+def _get_codes():
+    return get_class('search.utils', 'FACET_ATTRIBUTE_CODES')
+
+
+def _get_timeout():
+    return getattr(settings, 'CASEARCH_FACET_BITMAPS_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def _get_values(**filters):
+    return ProductAttributeValue.objects.filter(
+        attribute__code__in=_get_codes(),
+        product__parent__isnull=True,
+        **filters
+    ).exclude(
+        value_text__isnull=True
+    ).exclude(
+        value_text=''
+    ).values_list('attribute__code', 'value_text', 'product_id')
+
+
+def build_facet_bitmaps():
+    """
+    Return a dict of attribute code to a dict of value to the bitmap of
+    the ids of the products having it, read with one query.
+    """
+    ids = dict((code, {}) for code in _get_codes())
+    for code, value, product_id in _get_values():
+        ids[code].setdefault(value, []).append(product_id)
+    return dict(
+        (code, dict((value, Bitmap.from_ids(pks)) for value, pks in values.items()))
+        for code, values in ids.items())
+
+
+def _dumps(bitmaps):
+    return dict(
+        (code, dict((value, bitmap.to_bytes()) for value, bitmap in values.items()))
+        for code, values in bitmaps.items())
+
+
+def _loads(data):
+    return dict(
+        (code, dict((value, Bitmap.from_bytes(b)) for value, b in values.items()))
+        for code, values in data.items())
+
+
+def get_facet_bitmaps():
+    """
+    Return the facet bitmaps, kept in the shared cache until an attribute
+    value changes.
+    """
+    data = cache.get(FACET_BITMAPS_CACHE_KEY)
+    if data is not None:
+        return _loads(data)
+    bitmaps = build_facet_bitmaps()
+    cache.set(FACET_BITMAPS_CACHE_KEY, _dumps(bitmaps), _get_timeout())
+    return bitmaps
+
+
+def invalidate_facet_bitmaps():
+    """
+    Drop the cached bitmaps after an attribute value changed, the next
+    read builds them again with its single query. Patching the cached
+    bitmaps instead would race with other writers and rewrite them whole
+    on every save.
+    """
+    cache.delete(FACET_BITMAPS_CACHE_KEY)
+    # again once committed, in case a read rebuilt them meanwhile from the
+    # values as they were.
+    transaction.on_commit(lambda: cache.delete(FACET_BITMAPS_CACHE_KEY))
+
+
+def get_facet_counts(queryset):
+    """
+    Return a dict of attribute code to (value, count) pairs for the
+    products of the queryset, by most products first.
+
+    The queryset is only read for its ids, the counts all come from
+    intersecting them with the facet bitmaps.
+    """
+    return count_facets(queryset.order_by().values_list('pk', flat=True))
+
+
+def count_facets(product_ids):
+    """
+    Same as get_facet_counts, for products already known by id.
+    """
+    results = Bitmap.from_ids(product_ids)
+    counts = {}
+    for code, values in get_facet_bitmaps().items():
+        counts[code] = sorted(
+            ((value, len(bitmap & results)) for value, bitmap in values.items()),
+            key=lambda c: (-c[1], c[0].lower()))
+    return counts
+
+
+def get_search_facet_counts(request_data, get_product_ids, scope=()):
+    """
+    Return the grade, carrier and price counts of a search, cached in the
+    shared cache per search and catalogue version. get_product_ids is
+    only called on a miss, so pages of a broad listing do not read every
+    matching id. scope tells apart searches of the same parameters, eg.
+    the category ids.
+    """
+    params = normalize_search_params(request_data)
+    # the order of the results changes nothing.
+    params.pop('sort_by')
+    key = FACET_COUNTS_CACHE_KEY % hashlib.md5(repr(
+        (list(params.items()), tuple(scope), get_catalogue_version())
+    ).encode('utf-8')).hexdigest()
+    counts = cache.get(key)
+    if counts is None:
+        product_ids = get_product_ids()
+        counts = count_facets(product_ids)
+        counts['price'] = count_price_buckets(product_ids)
+        cache.set(key, counts, getattr(settings, 'CASEARCH_FACET_COUNTS_CACHE_TIMEOUT', 60 * 60))
+    return counts
@@ -0,0 +1,349 @@
+"""
+Product feeds for marketplaces and search engines: CSV, Google Shopping
+XML and sitemaps, written as gzip compressed shards.
+
+Products are sharded by id range, so a product change only affects its
+own shard. Each feed keeps a manifest of a signature per shard (product
+count, id sum and latest change) and only rewrites the shards whose
+signature changed since the last run.
+"""
+import abc
+import csv
+import gzip
+import json
+import os
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.urlresolvers import reverse
+from django.db.models import Count, ExpressionWrapper, F, IntegerField, Max, Sum
+from django.utils import six, timezone
+from django.utils.encoding import force_str, force_text
+from oscar.core.loading import get_class, get_model
+
+Product = get_model('catalogue', 'Product')
+
+MANIFEST_FILENAME = 'manifest.json'
+
+
+def get_feeds_root():
+    return getattr(settings, 'CASEARCH_FEEDS_ROOT', os.path.join(settings.BASE_DIR, 'feeds'))
+
+
+def get_base_url():
+    return getattr(settings, 'CASEARCH_FEEDS_BASE_URL', None) or \
+        'http://%s' % Site.objects.get_current().domain
+
+
+def get_shard_signatures(shard_size):
+    """
+    Return a dict of shard number to the signature of its products, read
+    with one aggregate query.
+    """
+    rows = Product.browsable.annotate(
+        shard=ExpressionWrapper(F('pk') / shard_size, output_field=IntegerField())
+    ).values('shard').annotate(
+        count=Count('pk'), pk_sum=Sum('pk'),
+        updated=Max('date_updated'), record_updated=Max('search_record__date_updated'),
+    ).order_by('shard')
+    return dict(
+        (row['shard'], '%(count)s:%(pk_sum)s:%(updated)s:%(record_updated)s' % row)
+        for row in rows)
+
+
+def iter_shard_products(shard, shard_size, chunk_size):
+    """
+    Yield the browsable products of a shard in id order, loaded chunk_size
+    at a time with their stock records, children and images prefetched.
+    """
+    ids = Product.browsable.filter(
+        pk__gte=shard * shard_size, pk__lt=(shard + 1) * shard_size
+    ).order_by('pk').values_list('pk', flat=True).iterator()
+    chunk = []
+    for pk in ids:
+        chunk.append(pk)
+        if len(chunk) == chunk_size:
+            for product in _load_products(chunk):
+                yield product
+            chunk = []
+    for product in _load_products(chunk):
+        yield product
+
+
+def _load_products(ids):
+    if not ids:
+        return []
+    return Product.browsable.base_queryset().filter(pk__in=ids).select_related(
+        'search_record'
+    ).prefetch_related(
+        'children__stockrecords'
+    ).order_by('pk')
+
+
+class FeedItem(object):
+    """
+    What the feeds say about a product, with the price and availability
+    the partner strategy resolves for it.
+    """
+
+    def __init__(self, product, info, base_url):
+        self.product = product
+        self.id = product.pk
+        self.upc = product.upc or ''
+        self.title = product.get_title()
+        self.description = product.description or ''
+        self.url = base_url + product.get_absolute_url()
+        self.date_updated = product.date_updated
+        price = info.price
+        if price.exists:
+            self.price = price.incl_tax if price.is_tax_known else price.excl_tax
+            self.currency = price.currency
+        else:
+            self.price = None
+            self.currency = ''
+        self.is_available = info.availability.is_available_to_buy
+        try:
+            record = product.search_record
+        except ObjectDoesNotExist:
+            self.grade = self.carrier = ''
+        else:
+            self.grade, self.carrier = ', '.join(record.grades), ', '.join(record.carriers)
+        image = product.primary_image()
+        # a dict stands for the missing image placeholder.
+        self.image_url = '' if isinstance(image, dict) else base_url + image.original.url
+
+
+@six.add_metaclass(abc.ABCMeta)
+class Feed(object):
+    """
+    A feed format: the text of a shard is the header, an entry per item
+    and the footer. Formats define entry, and header, footer and
+    write_index as they need them.
+    """
+    name = None
+    extension = None
+    content_type = None
+
+    def __init__(self, root=None, shard_size=None, chunk_size=None, base_url=None):
+        self.root = self.get_root(root)
+        self.shard_size = shard_size or getattr(settings, 'CASEARCH_FEEDS_SHARD_SIZE', 10000)
+        self.chunk_size = chunk_size or getattr(settings, 'CASEARCH_FEEDS_CHUNK_SIZE', 500)
+        self.base_url = base_url or get_base_url()
+        self.strategy = get_class('partner.strategy', 'Selector')().strategy()
+
+    @classmethod
+    def get_root(cls, root=None):
+        """
+        Return the directory of the feed's files, known without building
+        the feed, eg. to serve them.
+        """
+        return os.path.join(root or get_feeds_root(), cls.name)
+
+    def get_filename(self, shard):
+        return '%s-%d.%s.gz' % (self.name, shard, self.extension)
+
+    def header(self):
+        return ''
+
+    @abc.abstractmethod
+    def entry(self, item):
+        """
+        Return the text of an item, a FeedItem.
+        """
+
+    def footer(self):
+        return ''
+
+    def write_index(self, shards):
+        """
+        Write whatever lists the shards, if the format has one.
+        """
+
+    def get_items(self, shard):
+        for product in iter_shard_products(shard, self.shard_size, self.chunk_size):
+            if product.is_parent:
+                info = self.strategy.fetch_for_parent(product)
+            else:
+                info = self.strategy.fetch_for_product(product)
+            yield FeedItem(product, info, self.base_url)
+
+    def write_shard(self, shard):
+        path = os.path.join(self.root, self.get_filename(shard))
+        tmp_path = '%s.tmp' % path
+        with gzip.open(tmp_path, 'wb') as f:
+            f.write(self.header().encode('utf-8'))
+            for item in self.get_items(shard):
+                f.write(self.entry(item).encode('utf-8'))
+            f.write(self.footer().encode('utf-8'))
+        # readers always see a whole shard.
+        os.rename(tmp_path, path)
+
+    def read_manifest(self):
+        try:
+            with open(os.path.join(self.root, MANIFEST_FILENAME)) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def write_manifest(self, manifest):
+        path = os.path.join(self.root, MANIFEST_FILENAME)
+        with open('%s.tmp' % path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.rename('%s.tmp' % path, path)
+
+    def generate(self, force=False):
+        """
+        Bring the shards up to date with the catalogue, rewriting only the
+        ones whose products changed unless force is given. Return the
+        numbers of shards written, unchanged and removed.
+        """
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        manifest = self.read_manifest()
+        previous = manifest.get('shards', {})
+        if manifest.get('shard_size') != self.shard_size:
+            # ids map to other shards now.
+            force = True
+        signatures = get_shard_signatures(self.shard_size)
+
+        shards = {}
+        written = unchanged = 0
+        for shard, signature in sorted(signatures.items()):
+            entry = previous.get(str(shard))
+            filename = self.get_filename(shard)
+            if not force and entry and entry['signature'] == signature and \
+                    os.path.exists(os.path.join(self.root, filename)):
+                shards[str(shard)] = entry
+                unchanged += 1
+                continue
+            self.write_shard(shard)
+            shards[str(shard)] = {
+                'signature': signature,
+                'filename': filename,
+                'date_generated': timezone.now().isoformat(),
+            }
+            written += 1
+
+        removed = 0
+        for shard, entry in previous.items():
+            if shard not in shards and entry['filename'] not in \
+                    set(e['filename'] for e in shards.values()):
+                try:
+                    os.remove(os.path.join(self.root, entry['filename']))
+                except OSError:
+                    pass
+                removed += 1
+
+        self.write_index(shards)
+        self.write_manifest({'shard_size': self.shard_size, 'shards': shards})
+        return written, unchanged, removed
+
+
+class CSVFeed(Feed):
+    name = 'csv'
+    extension = 'csv'
+    content_type = 'text/csv'
+    columns = (
+        'id', 'upc', 'title', 'url', 'price', 'currency', 'availability',
+        'grade', 'carrier', 'image_url')
+
+    def row(self, values):
+        out = six.StringIO()
+        csv.writer(out).writerow([force_str(v) for v in values])
+        return force_text(out.getvalue())
+
+    def header(self):
+        return self.row(self.columns)
+
+    def entry(self, item):
+        return self.row([
+            item.id, item.upc, item.title, item.url,
+            '' if item.price is None else item.price, item.currency,
+            'in stock' if item.is_available else 'out of stock',
+            item.grade, item.carrier, item.image_url])
+
+
+class GoogleShoppingFeed(Feed):
+    """
+    RSS 2.0 with the Google Shopping (g:) elements.
+    """
+    name = 'google'
+    extension = 'xml'
+    content_type = 'application/xml'
+
+    def header(self):
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">\n<channel>\n'
+            '<title>%s</title>\n<link>%s</link>\n<description>%s</description>\n' % (
+                escape(Site.objects.get_current().name), escape(self.base_url),
+                escape(force_text(getattr(settings, 'OSCAR_SHOP_NAME', '')))))
+
+    def entry(self, item):
+        if item.price is None:
+            # google rejects items without a price.
+            return ''
+        elements = [
+            ('g:id', item.id),
+            ('g:title', item.title),
+            ('g:description', item.description or item.title),
+            ('g:link', item.url),
+            ('g:price', '%s %s' % (item.price, item.currency)),
+            ('g:availability', 'in stock' if item.is_available else 'out of stock'),
+            ('g:condition', getattr(settings, 'CASEARCH_FEEDS_CONDITION', 'used')),
+        ]
+        if item.image_url:
+            elements.append(('g:image_link', item.image_url))
+        if item.upc:
+            elements.append(('g:gtin', item.upc))
+        if item.grade:
+            elements.append(('g:custom_label_0', item.grade))
+        if item.carrier:
+            elements.append(('g:custom_label_1', item.carrier))
+        return '<item>\n%s</item>\n' % ''.join(
+            '<%s>%s</%s>\n' % (name, escape(force_text(value)), name) for name, value in elements)
+
+    def footer(self):
+        return '</channel>\n</rss>\n'
+
+
+class SitemapFeed(Feed):
+    """
+    Sitemap shards of product pages, listed by a sitemap index.
+    """
+    name = 'sitemap'
+    extension = 'xml'
+    content_type = 'application/xml'
+    index_filename = 'sitemap.xml'
+
+    def header(self):
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+
+    def entry(self, item):
+        return '<url><loc>%s</loc><lastmod>%s</lastmod></url>\n' % (
+            escape(item.url), item.date_updated.date().isoformat())
+
+    def footer(self):
+        return '</urlset>\n'
+
+    def write_index(self, shards):
+        path = os.path.join(self.root, self.index_filename)
+        with open('%s.tmp' % path, 'wb') as f:
+            f.write(
+                b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                b'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+            for shard, entry in sorted(shards.items(), key=lambda s: int(s[0])):
+                url = self.base_url + reverse('casearch:feed', kwargs={
+                    'feed': self.name, 'filename': entry['filename']})
+                f.write((
+                    '<sitemap><loc>%s</loc><lastmod>%s</lastmod></sitemap>\n' % (
+                        escape(url), entry['date_generated'])).encode('utf-8'))
+            f.write(b'</sitemapindex>\n')
+        os.rename('%s.tmp' % path, path)
+
+
+FEEDS = dict((feed.name, feed) for feed in (CSVFeed, GoogleShoppingFeed, SitemapFeed))
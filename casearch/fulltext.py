@@ -0,0 +1,63 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import F, FloatField, TextField, Value
+from django.db.models.functions import Cast
+from django.utils.html import strip_tags
+
+# no stemming or stop words, grade "A" must stay searchable.
+SEARCH_CONFIG = 'simple'
+VECTOR_FIELD = 'search_record__search_vector'
+
+
+class PrefixSearchQuery(SearchQuery):
+    """
+    Full-text query matching every word of the search text as a prefix,
+    so "sams gal" finds "Samsung Galaxy".
+    """
+
+    def __init__(self, value, output_field=None, **extra):
+        self.terms = re.findall(r'\w+', value, re.UNICODE)
+        super(PrefixSearchQuery, self).__init__(value, output_field=output_field, **extra)
+
+    def as_sql(self, compiler, connection):
+        # the terms are plain word characters, nothing to escape in them.
+        params = [' & '.join('%s:*' % term for term in self.terms)]
+        if self.config:
+            config_sql, config_params = compiler.compile(self.config)
+            template = 'to_tsquery({}::regconfig, %s)'.format(config_sql)
+            params = config_params + params
+        else:
+            template = 'to_tsquery(%s)'
+        return template, params
+
+
+def get_search_vector(product, attribute_values):
+    """
+    Return the weighted search vector expression for a product: title and
+    UPC first, then the grade/carrier attribute values, then description.
+    """
+    def vector(text, weight):
+        return SearchVector(
+            Value(text, output_field=TextField()), weight=weight, config=SEARCH_CONFIG)
+
+    return (
+        vector(product.title, 'A') +
+        vector(product.upc or '', 'A') +
+        vector(' '.join(attribute_values), 'B') +
+        vector(strip_tags(product.description or ''), 'C'))
+
+
+def filter_by_query(queryset, query):
+    """
+    Restrict a product queryset to the full-text matches of the search
+    text, annotated with their relevance as `rank`.
+    """
+    search_query = PrefixSearchQuery(query, config=SEARCH_CONFIG)
+    if not search_query.terms:
+        # nothing the index can match on, eg. only punctuation.
+        return queryset.filter(title__icontains=query).annotate(
+            rank=Value(0.0, output_field=FloatField()))
+    return queryset.filter(**{VECTOR_FIELD: search_query}).annotate(
+        # double precision survives the pagination cursor round trip.
+        rank=Cast(SearchRank(F(VECTOR_FIELD), search_query), FloatField()))
@@ -0,0 +1,77 @@
+from django.db.models import signals
+from haystack.exceptions import NotHandled
+from haystack.signals import BaseSignalProcessor
+from haystack.utils import get_identifier
+from oscar.core.loading import get_model
+
+from casearch.models import QueuedIndexUpdate
+
+Product = get_model('catalogue', 'Product')
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+StockRecord = get_model('partner', 'StockRecord')
+
+# changes to these make a product's index document stale.
+QUEUED_MODELS = (Product, StockRecord, ProductAttributeValue)
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+    """
+    Queue the products whose index documents changed instead of
+    reindexing them while saving, which keeps index writes off the
+    dashboard and importer requests. casearch_process_index_queue applies
+    the queue in batches.
+    """
+
+    def setup(self):
+        for model in QUEUED_MODELS:
+            signals.post_save.connect(self.enqueue, sender=model)
+            signals.post_delete.connect(self.enqueue, sender=model)
+
+    def teardown(self):
+        for model in QUEUED_MODELS:
+            signals.post_save.disconnect(self.enqueue, sender=model)
+            signals.post_delete.disconnect(self.enqueue, sender=model)
+
+    def enqueue(self, sender, instance, **kwargs):
+        if kwargs.get('raw', False):
+            return
+        if isinstance(instance, Product):
+            product_id = instance.pk
+        else:
+            product_id = instance.product_id
+        QueuedIndexUpdate.objects.enqueue(product_id)
+
+
+def process_index_queue(connections, using, batch_size):
+    """
+    Apply up to batch_size queued updates to the index and return how
+    many were taken off the queue.
+
+    Repeated updates of a product collapse into one, and child products
+    reindex their parent, the product the index holds.
+    """
+    entries = list(QueuedIndexUpdate.objects.order_by('pk')[:batch_size])
+    if not entries:
+        return 0
+    product_ids = set(entry.product_id for entry in entries)
+    product_ids.update(
+        parent_id for parent_id in Product.objects.filter(
+            pk__in=product_ids, parent__isnull=False).values_list('parent_id', flat=True))
+
+    try:
+        index = connections[using].get_unified_index().get_index(Product)
+    except NotHandled:
+        index = None
+    if index is not None:
+        backend = connections[using].get_backend()
+        products = list(index.index_queryset(using).filter(pk__in=product_ids))
+        if products:
+            backend.update(index, products)
+        # deleted, or no longer indexed such as products turned children.
+        for product_id in product_ids - set(product.pk for product in products):
+            backend.remove(get_identifier(Product(pk=product_id)))
+
+    # only the entries read above: a product queued again meanwhile may
+    # have changed after we indexed it.
+    QueuedIndexUpdate.objects.filter(pk__in=[entry.pk for entry in entries]).delete()
+    return len(entries)
@@ -0,0 +1,77 @@
+import json
+import logging
+import random
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+from casearch.utils import normalize_search_params
+
+logger = logging.getLogger('casearch.slow_search')
+
+
+class SearchProfile(object):
+    """
+    Time and query count of each stage of a search request.
+
+    Once the request is done, finish() writes it to the slow search log
+    if it took longer than CASEARCH_SLOW_SEARCH_THRESHOLD milliseconds,
+    along with the normalized search parameters and how often the
+    strategy priced a product afresh rather than from its memo.
+
+    Queries are counted with DEBUG on, and otherwise in the share of the
+    searches given by CASEARCH_QUERY_COUNT_SAMPLE_RATE only: counting
+    them takes the debug cursor, which keeps and logs every query.
+    """
+
+    def __init__(self, name, request_data, strategy=None):
+        self.name = name
+        self.request_data = request_data
+        self.strategy = strategy
+        self.stages = OrderedDict()
+        rate = getattr(settings, 'CASEARCH_QUERY_COUNT_SAMPLE_RATE', 0)
+        self.count_queries = settings.DEBUG or bool(rate and random.random() < rate)
+        self.start = time.time()
+
+    @contextmanager
+    def stage(self, name):
+        if self.count_queries:
+            # the queries are only recorded with DEBUG on, unless forced.
+            force_debug_cursor = connection.force_debug_cursor
+            connection.force_debug_cursor = True
+            queries = len(connection.queries_log)
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed, count = self.stages.get(name, (0, 0))
+            if self.count_queries:
+                count += len(connection.queries_log) - queries
+                connection.force_debug_cursor = force_debug_cursor
+            self.stages[name] = (elapsed + time.time() - start, count)
+
+    def finish(self):
+        elapsed = time.time() - self.start
+        threshold = getattr(settings, 'CASEARCH_SLOW_SEARCH_THRESHOLD', 500)
+        if threshold is not None and elapsed * 1000 >= threshold:
+            logger.warning('Slow search %s', json.dumps(self.as_dict(elapsed)))
+        return elapsed
+
+    def as_dict(self, elapsed):
+        # queries are None when not counted.
+        data = OrderedDict([
+            ('view', self.name),
+            ('ms', int(elapsed * 1000)),
+            ('queries', sum(count for ms, count in self.stages.values()) if self.count_queries else None),
+            ('params', normalize_search_params(self.request_data)),
+            ('page', self.request_data.get('page', 1)),
+            ('stages', OrderedDict(
+                (name, {'ms': int(ms * 1000), 'queries': count if self.count_queries else None})
+                for name, (ms, count) in self.stages.items())),
+        ])
+        if hasattr(self.strategy, 'get_purchase_info_stats'):
+            data['purchase_info'] = self.strategy.get_purchase_info_stats()
+        return data
@@ -0,0 +1,630 @@
+"""
+Compact on-disk inverted index for the catalogue, searched in-process.
+
+The index is a segment file plus an append-only delta log next to it:
+
+* the segment holds every document as a number (docno): the sorted term
+  dictionary with a posting list of docnos per term, a bitmap of docnos
+  per facet value, the price of each document and the docnos sorted by
+  price. It is opened with mmap, so all the workers on a host share the
+  same pages and only read the parts a query touches.
+* the delta log holds the documents added or removed since the segment
+  was written, one json line each. Readers overlay it on the segment, and
+  writers fold it into a new segment once it grows past a threshold.
+
+Writers serialize on a lock file; the segment is replaced atomically, so
+readers never need a lock.
+"""
+import fcntl
+import json
+import math
+import mmap
+import os
+import re
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import merge, nsmallest
+from itertools import chain
+
+from django.utils import six
+
+from casearch.bitmaps import Bitmap
+
+MAGIC = b'CAIX0001'
+HEADER = struct.Struct('<8sI')
+SEGMENT_SUFFIX = '.seg'
+DELTA_SUFFIX = '.delta'
+LOCK_SUFFIX = '.lock'
+DEFAULT_MERGE_THRESHOLD = 1000
+
+# lowercase word characters, the same tokens as the postgres 'simple' config.
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(six.text_type(text).lower())
+
+
+def _to_array(typecode, data=b''):
+    values = array(typecode)
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    return values
+
+
+def _to_bytes(values):
+    if hasattr(values, 'tobytes'):
+        return values.tobytes()
+    return values.tostring()
+
+
+class Document(object):
+    """
+    What the index keeps of an indexed object: its key, the search terms,
+    the facet values by field and an optional price.
+    """
+    __slots__ = ('content_type', 'pk', 'terms', 'facets', 'price')
+
+    def __init__(self, content_type, pk, terms=(), facets=None, price=None):
+        self.content_type = content_type
+        self.pk = int(pk)
+        self.terms = set(terms)
+        self.facets = facets or {}
+        self.price = price
+
+    @property
+    def key(self):
+        return (self.content_type, self.pk)
+
+    def to_json(self):
+        return {
+            'ct': self.content_type,
+            'pk': self.pk,
+            'terms': sorted(self.terms),
+            'facets': self.facets,
+            'price': self.price,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['ct'], data['pk'], data['terms'], data['facets'], data['price'])
+
+
+def build_segment(documents):
+    """
+    Serialize documents into segment bytes. Documents are numbered by
+    content type, then newest (highest pk) first, which is the order of
+    results that are not sorted otherwise.
+    """
+    documents = sorted(documents, key=lambda d: (d.content_type, -d.pk))
+    content_types = sorted(set(d.content_type for d in documents))
+    ct_index = dict((ct, i) for i, ct in enumerate(content_types))
+
+    postings = {}
+    facets = {}
+    prices = array('d')
+    for docno, doc in enumerate(documents):
+        for term in doc.terms:
+            postings.setdefault(term, []).append(docno)
+        for field, values in doc.facets.items():
+            for value in values:
+                facets.setdefault(field, {}).setdefault(value, []).append(docno)
+        prices.append(float('nan') if doc.price is None else doc.price)
+
+    terms = sorted(postings)
+    term_blob = bytearray()
+    term_offsets = array('I', [0])
+    posting_list = array('i')
+    posting_offsets = array('I', [0])
+    for term in terms:
+        term_blob.extend(term.encode('utf-8'))
+        term_offsets.append(len(term_blob))
+        posting_list.extend(postings[term])
+        posting_offsets.append(len(posting_list))
+
+    facet_blob = bytearray()
+    facet_meta = {}
+    for field, values in facets.items():
+        for value, docnos in values.items():
+            data = Bitmap.from_ids(docnos).to_bytes()
+            facet_meta.setdefault(field, {})[value] = [len(facet_blob), len(data)]
+            facet_blob.extend(data)
+
+    priced = [docno for docno, price in enumerate(prices) if not math.isnan(price)]
+    price_order = array('i', sorted(priced, key=lambda docno: (prices[docno], docno)))
+
+    sections = [
+        ('pks', _to_bytes(array('i', [d.pk for d in documents]))),
+        ('cts', _to_bytes(array('B', [ct_index[d.content_type] for d in documents]))),
+        ('prices', _to_bytes(prices)),
+        ('price_order', _to_bytes(price_order)),
+        ('term_offsets', _to_bytes(term_offsets)),
+        ('terms', bytes(term_blob)),
+        ('posting_offsets', _to_bytes(posting_offsets)),
+        ('postings', _to_bytes(posting_list)),
+        ('facets', bytes(facet_blob)),
+    ]
+    offset = 0
+    section_meta = {}
+    for name, data in sections:
+        section_meta[name] = [offset, len(data)]
+        offset += len(data)
+    meta = json.dumps({
+        'doc_count': len(documents),
+        'content_types': content_types,
+        'facets': facet_meta,
+        'sections': section_meta,
+    }).encode('utf-8')
+    return b''.join(
+        [HEADER.pack(MAGIC, len(meta)), meta] + [data for name, data in sections])
+
+
+class _Column(object):
+    """
+    Read-only sequence over a fixed width section of the segment, decoded
+    one item at a time so bisect can search it in place.
+    """
+
+    def __init__(self, buf, offset, length, typecode):
+        self.buf = buf
+        self.offset = offset
+        self.typecode = typecode
+        self.format = struct.Struct(str('=' + typecode))
+        self.length = length // self.format.size
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.length:
+            raise IndexError(i)
+        return self.format.unpack_from(self.buf, self.offset + i * self.format.size)[0]
+
+    def slice(self, start, stop):
+        size = self.format.size
+        return _to_array(self.typecode, self.buf[
+            self.offset + start * size:self.offset + stop * size])
+
+
+class _Terms(object):
+
+    def __init__(self, segment):
+        self.offsets = segment.column('term_offsets', 'I')
+        self.blob_offset = segment.sections['terms'][0]
+        self.buf = segment.buf
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start = self.blob_offset + self.offsets[i]
+        end = self.blob_offset + self.offsets[i + 1]
+        return self.buf[start:end].decode('utf-8')
+
+
+class _SortedPrices(object):
+
+    def __init__(self, segment):
+        self.order = segment.price_order
+        self.prices = segment.prices
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, i):
+        return self.prices[self.order[i]]
+
+
+class Segment(object):
+    """
+    Read-only view over segment bytes, either a mmap of the segment file
+    or an in-memory buffer for the delta.
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        magic, meta_length = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a search index segment')
+        meta = json.loads(buf[HEADER.size:HEADER.size + meta_length].decode('utf-8'))
+        self.data_offset = HEADER.size + meta_length
+        self.doc_count = meta['doc_count']
+        self.content_types = meta['content_types']
+        self.facet_sections = meta['facets']
+        self.sections = dict(
+            (name, (self.data_offset + offset, length))
+            for name, (offset, length) in meta['sections'].items())
+
+        self.pks = self.column('pks', 'i')
+        self.cts = self.column('cts', 'B')
+        self.prices = self.column('prices', 'd')
+        self.price_order = self.column('price_order', 'i')
+        self.posting_offsets = self.column('posting_offsets', 'I')
+        self.postings = self.column('postings', 'i')
+        self.terms = _Terms(self)
+
+    @classmethod
+    def empty(cls):
+        return cls(build_segment([]))
+
+    def column(self, name, typecode):
+        offset, length = self.sections[name]
+        return _Column(self.buf, offset, length, typecode)
+
+    def key(self, docno):
+        return (self.content_types[self.cts[docno]], self.pks[docno])
+
+    def find(self, key):
+        """
+        Return the docno of the document with the key, or None.
+        """
+        content_type, pk = key
+        if content_type not in self.content_types:
+            return None
+        ct = self.content_types.index(content_type)
+        # docnos follow (content type, -pk), so bisect on that.
+        lo = bisect_left(_KeyColumn(self), (ct, -pk))
+        if lo < self.doc_count and self.cts[lo] == ct and self.pks[lo] == pk:
+            return lo
+        return None
+
+    def all(self):
+        return Bitmap.full(self.doc_count)
+
+    def prefix(self, prefix):
+        """
+        Return the docnos of the documents with a term starting with prefix.
+        """
+        start = bisect_left(self.terms, prefix)
+        end = start
+        while end < len(self.terms) and self.terms[end].startswith(prefix):
+            end += 1
+        if start == end:
+            return Bitmap()
+        return Bitmap.from_ids(self.postings.slice(
+            self.posting_offsets[start], self.posting_offsets[end]))
+
+    def facet(self, field, value):
+        try:
+            offset, length = self.facet_sections[field][value]
+        except KeyError:
+            return Bitmap()
+        start = self.sections['facets'][0] + offset
+        return Bitmap.from_bytes(self.buf[start:start + length])
+
+    def facet_values(self, field):
+        return list(self.facet_sections.get(field, ()))
+
+    def price_range(self, low=None, high=None):
+        prices = _SortedPrices(self)
+        start = 0 if low is None else bisect_left(prices, low)
+        end = len(prices) if high is None else bisect_right(prices, high)
+        if start >= end:
+            return Bitmap()
+        return Bitmap.from_ids(self.price_order.slice(start, end))
+
+    def by_price(self, descending=False):
+        """
+        Yield (price, docno) for the documents with a price, cheapest first
+        or dearest first. Ties go by docno either way.
+        """
+        if not descending:
+            for i in range(len(self.price_order)):
+                docno = self.price_order[i]
+                yield self.prices[docno], docno
+            return
+        # backwards a run of equal prices at a time, each run forwards.
+        end = len(self.price_order)
+        while end > 0:
+            price = self.prices[self.price_order[end - 1]]
+            start = end - 1
+            while start > 0 and self.prices[self.price_order[start - 1]] == price:
+                start -= 1
+            for i in range(start, end):
+                yield price, self.price_order[i]
+            end = start
+
+    def documents(self):
+        """
+        Rebuild the documents of the segment, for merging it.
+        """
+        documents = [Document(*self.key(docno)) for docno in range(self.doc_count)]
+        for i in range(len(self.terms)):
+            term = self.terms[i]
+            for docno in self.postings.slice(self.posting_offsets[i], self.posting_offsets[i + 1]):
+                documents[docno].terms.add(term)
+        for field in self.facet_sections:
+            for value in self.facet_values(field):
+                for docno in self.facet(field, value):
+                    documents[docno].facets.setdefault(field, []).append(value)
+        for docno, doc in enumerate(documents):
+            price = self.prices[docno]
+            doc.price = None if math.isnan(price) else price
+        return documents
+
+
+class _KeyColumn(object):
+
+    def __init__(self, segment):
+        self.segment = segment
+
+    def __len__(self):
+        return self.segment.doc_count
+
+    def __getitem__(self, i):
+        return (self.segment.cts[i], -self.segment.pks[i])
+
+
+class Snapshot(object):
+    """
+    The segment with the delta laid over it, as of one refresh. Delta
+    documents are numbered after the segment ones, and segment documents
+    the delta replaces or removes are masked out as dead.
+    """
+
+    def __init__(self, segment, delta, dead):
+        self.segment = segment
+        self.delta = delta
+        self.dead = dead
+
+    @property
+    def doc_count(self):
+        return self.segment.doc_count + self.delta.doc_count
+
+    @property
+    def pending(self):
+        return self.delta.doc_count + len(self.dead)
+
+    def _combine(self, segment_bits, delta_bits):
+        return Bitmap(
+            (segment_bits - self.dead).bits | (delta_bits.bits << self.segment.doc_count))
+
+    def all(self):
+        return self._combine(self.segment.all(), self.delta.all())
+
+    def prefix(self, prefix):
+        return self._combine(self.segment.prefix(prefix), self.delta.prefix(prefix))
+
+    def facet(self, field, value):
+        return self._combine(self.segment.facet(field, value), self.delta.facet(field, value))
+
+    def facet_values(self, field):
+        values = set(self.segment.facet_values(field))
+        values.update(self.delta.facet_values(field))
+        return values
+
+    def price_range(self, low=None, high=None):
+        return self._combine(
+            self.segment.price_range(low, high), self.delta.price_range(low, high))
+
+    def key(self, docno):
+        if docno < self.segment.doc_count:
+            return self.segment.key(docno)
+        return self.delta.key(docno - self.segment.doc_count)
+
+    def price(self, docno):
+        if docno < self.segment.doc_count:
+            return self.segment.prices[docno]
+        return self.delta.prices[docno - self.segment.doc_count]
+
+    def ordered(self, matches, sort_by_price=None, limit=None):
+        """
+        Yield the matching docnos in result order: index order, or by price
+        ('asc' or 'desc') with the unpriced documents after the priced ones.
+
+        With a limit only that many docnos are guaranteed to be in order.
+        Walking the price order visits about limit * doc_count / matches
+        documents before the page is full, so sparse matches are ranked
+        with a heap of limit entries instead, which visits each match once.
+        """
+        if sort_by_price is None:
+            return iter(matches)
+        descending = sort_by_price == 'desc'
+        if limit is not None:
+            count = len(matches)
+            if count * count < limit * self.doc_count:
+                return self.top_by_price(matches, descending, limit)
+        offset = self.segment.doc_count
+        delta = ((price, docno + offset) for price, docno in self.delta.by_price(descending))
+        if descending:
+            by_price = merge(
+                ((-price, docno) for price, docno in self.segment.by_price(True)),
+                ((-price, docno) for price, docno in delta))
+        else:
+            by_price = merge(self.segment.by_price(), delta)
+        priced = (docno for price, docno in by_price if docno in matches)
+        return chain(priced, self.unpriced(matches))
+
+    def top_by_price(self, matches, descending, limit):
+        """
+        Yield the limit cheapest (or dearest) matching docnos in order,
+        then the unpriced ones. Ties go by docno, as in ordered.
+        """
+        sign = -1 if descending else 1
+        priced = (
+            (sign * price, docno)
+            for price, docno in ((self.price(docno), docno) for docno in matches)
+            if not math.isnan(price))
+        top = (docno for price, docno in nsmallest(limit, priced))
+        return chain(top, self.unpriced(matches))
+
+    def unpriced(self, matches):
+        # lazily, pages filled by priced documents never need it.
+        for docno in matches - self.price_range():
+            yield docno
+
+    def documents(self):
+        dead = self.dead
+        for docno, doc in enumerate(self.segment.documents()):
+            if docno not in dead:
+                yield doc
+        for doc in self.delta.documents():
+            yield doc
+
+
+class InvertedIndex(object):
+    """
+    Index stored at path (plus a suffix per file), shared by every process
+    opening the same path.
+    """
+
+    def __init__(self, path, merge_threshold=DEFAULT_MERGE_THRESHOLD):
+        self.path = path
+        self.merge_threshold = merge_threshold
+        self.segment_path = path + SEGMENT_SUFFIX
+        self.delta_path = path + DELTA_SUFFIX
+        self.lock_path = path + LOCK_SUFFIX
+        self._segment_stat = None
+        self._delta_stat = None
+        empty = Segment.empty()
+        self.snapshot = Snapshot(empty, empty, Bitmap())
+
+    # reading
+
+    def refresh(self):
+        """
+        Return the current snapshot, reopening the segment and rereading
+        the delta if a writer changed them since the last call.
+        """
+        segment_stat = self._stat(self.segment_path)
+        delta_stat = self._stat(self.delta_path)
+        if segment_stat == self._segment_stat and delta_stat == self._delta_stat:
+            return self.snapshot
+        segment = self.snapshot.segment
+        if segment_stat != self._segment_stat:
+            segment = self._open_segment()
+        documents, removed = self._read_delta()
+        dead = Bitmap.from_ids(
+            docno for docno in (segment.find(key) for key in removed | set(documents))
+            if docno is not None)
+        # swapped in one go, queries running in other threads keep the
+        # snapshot they started with.
+        self.snapshot = Snapshot(segment, Segment(build_segment(documents.values())), dead)
+        self._segment_stat = segment_stat
+        self._delta_stat = delta_stat
+        return self.snapshot
+
+    def _stat(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime)
+
+    def _open_segment(self):
+        # the map outlives the file being replaced, and is unmapped once no
+        # snapshot uses it anymore.
+        try:
+            with open(self.segment_path, 'rb') as f:
+                return Segment(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (IOError, OSError, ValueError):
+            return Segment.empty()
+
+    def _read_delta(self):
+        """
+        Replay the delta log, returning the documents it adds by key and
+        the keys it removes.
+        """
+        documents = {}
+        removed = set()
+        try:
+            with open(self.delta_path, 'rb') as f:
+                lines = f.read().split(b'\n')
+        except (IOError, OSError):
+            return documents, removed
+        # the last piece is empty, or a line still being written.
+        for line in lines[:-1]:
+            entry = json.loads(line.decode('utf-8'))
+            if entry['op'] == 'add':
+                doc = Document.from_json(entry['doc'])
+                documents[doc.key] = doc
+                removed.discard(doc.key)
+            else:
+                key = (entry['ct'], entry['pk'])
+                documents.pop(key, None)
+                removed.add(key)
+        return documents, removed
+
+    # writing
+
+    def add(self, documents):
+        self._write([{'op': 'add', 'doc': doc.to_json()} for doc in documents])
+
+    def remove(self, keys):
+        self._write([{'op': 'remove', 'ct': ct, 'pk': pk} for ct, pk in keys])
+
+    def clear(self, content_types=None):
+        with self._lock():
+            documents = []
+            if content_types is not None:
+                documents = [
+                    doc for doc in self.refresh().documents()
+                    if doc.content_type not in content_types]
+            self._write_segment(documents)
+
+    def rebuild(self, documents):
+        """
+        Replace the whole index with documents, in a single segment write.
+        """
+        with self._lock():
+            self._write_segment(documents)
+
+    def _write(self, entries):
+        if not entries:
+            return
+        with self._lock():
+            snapshot = self.refresh()
+            if snapshot.pending + len(entries) < self.merge_threshold:
+                with open(self.delta_path, 'ab') as f:
+                    f.write(b''.join(
+                        json.dumps(entry).encode('utf-8') + b'\n' for entry in entries))
+                return
+            # the delta is getting large, fold everything into a new segment.
+            documents = dict((doc.key, doc) for doc in snapshot.documents())
+            for entry in entries:
+                if entry['op'] == 'add':
+                    doc = Document.from_json(entry['doc'])
+                    documents[doc.key] = doc
+                else:
+                    documents.pop((entry['ct'], entry['pk']), None)
+            self._write_segment(documents.values())
+
+    def _write_segment(self, documents):
+        directory = os.path.dirname(self.segment_path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_path = '%s.%d.tmp' % (self.segment_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(build_segment(documents))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.segment_path)
+        # replaying the old delta over the new segment is harmless, so a
+        # reader catching the two halves apart sees no stale documents.
+        open(self.delta_path, 'wb').close()
+        self.refresh()
+
+    def _lock(self):
+        return _FileLock(self.lock_path)
+
+
+class _FileLock(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.file = open(self.path, 'a')
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
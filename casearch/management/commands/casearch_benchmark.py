@@ -0,0 +1,57 @@
+import json
+import platform
+import sys
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from casearch.benchmark import Catalogue, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Measure the search listings against synthetic catalogues of growing sizes and '
+            'write the results as JSON. Everything created is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='1000,10000,100000,1000000',
+            help='Comma separated catalogue sizes, in products')
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Requests per measurement, the first one is reported as cold')
+        parser.add_argument(
+            '--output', default=None,
+            help='File to write the results to, defaults to stdout')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        results = []
+        # the test client's host, and no failing on missing thumbnails.
+        with override_settings(ALLOWED_HOSTS=['*'], THUMBNAIL_DEBUG=False):
+            with transaction.atomic():
+                catalogue = Catalogue()
+                for size in sizes:
+                    self.stderr.write('Generating a catalogue of %d products...' % size)
+                    catalogue.grow(size)
+                    self.stderr.write('Measuring...')
+                    results.extend(run_benchmarks(catalogue, options['repeat']))
+                transaction.set_rollback(True)
+
+        report = {
+            'date': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sizes': sizes,
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        output = open(options['output'], 'w') if options['output'] else sys.stdout
+        try:
+            json.dump(report, output, indent=2, sort_keys=True)
+            output.write('\n')
+        finally:
+            if options['output']:
+                output.close()
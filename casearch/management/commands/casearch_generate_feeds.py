@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from casearch.feeds import FEEDS
+
+
+class Command(BaseCommand):
+    help = 'Write the product feeds and sitemaps, rewriting only the shards whose products changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--feed', action='append', choices=sorted(FEEDS), dest='feeds',
+            help='Feed to generate, may be repeated; all of them by default')
+        parser.add_argument(
+            '--force', action='store_true', default=False,
+            help='Rewrite every shard, changed or not')
+        parser.add_argument(
+            '--shard-size', type=int, default=None,
+            help='Product ids per shard, CASEARCH_FEEDS_SHARD_SIZE by default')
+        parser.add_argument(
+            '--chunk-size', type=int, default=None,
+            help='Products loaded and priced at a time, CASEARCH_FEEDS_CHUNK_SIZE by default')
+
+    def handle(self, *args, **options):
+        for name in options['feeds'] or sorted(FEEDS):
+            feed = FEEDS[name](shard_size=options['shard_size'], chunk_size=options['chunk_size'])
+            written, unchanged, removed = feed.generate(force=options['force'])
+            self.stdout.write('%s: %d shards written, %d unchanged, %d removed.' % (
+                name, written, unchanged, removed))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from haystack import connections
+from haystack.constants import DEFAULT_ALIAS
+
+from casearch.indexing import process_index_queue
+
+
+class Command(BaseCommand):
+    help = 'Apply the queued product changes to the search index in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Queued updates applied at a time')
+        parser.add_argument(
+            '--loop', action='store_true', default=False,
+            help='Keep waiting for new updates instead of exiting once the queue is empty')
+        parser.add_argument(
+            '--interval', type=float, default=2,
+            help='Seconds to wait between looks at an empty queue')
+        parser.add_argument(
+            '--using', default=DEFAULT_ALIAS,
+            help='Haystack connection to update')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_index_queue(connections, options['using'], options['batch_size'])
+            if processed:
+                self.stdout.write('Applied %d queued index updates.' % processed)
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
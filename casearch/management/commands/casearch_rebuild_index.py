@@ -0,0 +1,79 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from haystack import connections as haystack_connections
+from haystack.constants import DEFAULT_ALIAS
+from oscar.core.loading import get_model
+
+from casearch.invertedindex import Document
+from casearch.search_backend import InvertedIndexSearchBackend
+
+Product = get_model('catalogue', 'Product')
+
+
+def prepare_batch(args):
+    """
+    Return the index documents of a batch of products, as json so they
+    travel back from the pool cheaply.
+    """
+    using, pks = args
+    backend = haystack_connections[using].get_backend()
+    index = haystack_connections[using].get_unified_index().get_index(Product)
+    products = index.index_queryset(using).filter(pk__in=pks)
+    return [backend.get_document(index, product).to_json() for product in products]
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the inverted search index of the products, preparing them in parallel. '
+            'The current index keeps serving searches until the new one replaces it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=multiprocessing.cpu_count(),
+            help='Processes preparing products, 1 prepares them in this process')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Products a process prepares at a time')
+        parser.add_argument(
+            '--using', default=DEFAULT_ALIAS,
+            help='Haystack connection to rebuild')
+
+    def handle(self, *args, **options):
+        using = options['using']
+        backend = haystack_connections[using].get_backend()
+        if not isinstance(backend, InvertedIndexSearchBackend):
+            raise CommandError(
+                "Connection '%s' does not use the inverted index, use rebuild_index instead." % using)
+        index = haystack_connections[using].get_unified_index().get_index(Product)
+
+        pks = list(index.index_queryset(using).prefetch_related(None).order_by('pk').values_list(
+            'pk', flat=True))
+        batch_size = options['batch_size']
+        batches = [(using, pks[i:i + batch_size]) for i in range(0, len(pks), batch_size)]
+
+        if options['workers'] > 1:
+            # the forked processes must not share our database connection.
+            connections.close_all()
+            pool = multiprocessing.Pool(options['workers'])
+            results = pool.imap_unordered(prepare_batch, batches)
+        else:
+            pool = None
+            results = (prepare_batch(batch) for batch in batches)
+
+        documents = []
+        start = time.time()
+        for batch in results:
+            documents.extend(Document.from_json(data) for data in batch)
+            elapsed = time.time() - start
+            self.stdout.write('Prepared %d of %d products, %.0f products/s' % (
+                len(documents), len(pks), len(documents) / elapsed if elapsed else 0))
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        backend.index.rebuild(documents)
+        elapsed = time.time() - start
+        self.stdout.write('Indexed %d products in %.1fs, %.0f products/s.' % (
+            len(documents), elapsed, len(documents) / elapsed if elapsed else 0))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from casearch.pricebuckets import build_price_buckets, set_price_buckets
+
+
+class Command(BaseCommand):
+    help = 'Recompute the search price buckets from the current product prices'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--buckets', type=int, default=None,
+            help='Number of buckets, CASEARCH_PRICE_BUCKETS by default')
+
+    def handle(self, *args, **options):
+        buckets = build_price_buckets(options['buckets'])
+        set_price_buckets(buckets)
+        for bucket in buckets:
+            self.stdout.write('%s - %s: %d products' % (
+                bucket['min'] if bucket['min'] is not None else '',
+                bucket['max'] if bucket['max'] is not None else '',
+                bucket['count']))
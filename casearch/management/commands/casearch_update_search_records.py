@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from oscar.core.loading import get_class, get_model
+
+from casearch.models import ProductSearchRecord
+
+Product = get_model('catalogue', 'Product')
+Selector = get_class('partner.strategy', 'Selector')
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized product search records used by the search listings'
+
+    def handle(self, *args, **options):
+        strategy = Selector().strategy()
+        products = Product.objects.prefetch_related('stockrecords').order_by('pk')
+        count = 0
+        for product in products:
+            ProductSearchRecord.objects.update_for_product(product, strategy)
+            count += 1
+        self.stdout.write('Updated search records for %d products.' % count)
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 15:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('catalogue', '0009_slugfield_noop'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchRecord',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_record', serialize=False, to='catalogue.Product')),
+                ('price_excl_tax', models.DecimalField(blank=True, db_index=True, decimal_places=2, max_digits=12, null=True, verbose_name='Price (excl. tax)')),
+                ('price_currency', models.CharField(blank=True, default='', max_length=12, verbose_name='Currency')),
+                ('date_updated', models.DateTimeField(auto_now=True, verbose_name='Date updated')),
+            ],
+            options={
+                'verbose_name': 'Product search record',
+                'verbose_name_plural': 'Product search records',
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 15:27
+from __future__ import unicode_literals
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casearch', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productsearchrecord',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX casearch_productsearchrecord_search_vector_gin '
+            'ON casearch_productsearchrecord USING gin (search_vector);',
+            'DROP INDEX casearch_productsearchrecord_search_vector_gin;',
+        ),
+    ]
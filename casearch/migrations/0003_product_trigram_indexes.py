@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Trigram indexes backing the typeahead's case-insensitive substring
+    matches. They index the UPPER() expressions Django compiles
+    icontains/istartswith lookups to on PostgreSQL.
+    """
+
+    dependencies = [
+        ('casearch', '0002_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(
+            'CREATE INDEX casearch_product_title_trgm '
+            'ON catalogue_product USING gin (UPPER(title::text) gin_trgm_ops);',
+            'DROP INDEX casearch_product_title_trgm;',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX casearch_product_upc_trgm '
+            'ON catalogue_product USING gin (UPPER(upc::text) gin_trgm_ops);',
+            'DROP INDEX casearch_product_upc_trgm;',
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 15:37
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casearch', '0003_product_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedIndexUpdate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.IntegerField(db_index=True, verbose_name='Product ID')),
+                ('date_queued', models.DateTimeField(auto_now_add=True, verbose_name='Date queued')),
+            ],
+            options={
+                'verbose_name': 'Queued index update',
+                'verbose_name_plural': 'Queued index updates',
+            },
+        ),
+    ]
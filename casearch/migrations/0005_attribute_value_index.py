@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index backing the attribute facet subqueries: the product ids having
+    one of the values of an attribute, read from the index alone.
+    """
+
+    dependencies = [
+        ('casearch', '0004_index_queue'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX casearch_attributevalue_facet '
+            'ON catalogue_productattributevalue (attribute_id, value_text, product_id);',
+            'DROP INDEX casearch_attributevalue_facet;',
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 15:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casearch', '0005_attribute_value_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productsearchrecord',
+            name='carrier',
+            field=models.CharField(blank=True, default='', max_length=128, verbose_name='Carrier'),
+        ),
+        migrations.AddField(
+            model_name='productsearchrecord',
+            name='grade',
+            field=models.CharField(blank=True, default='', max_length=128, verbose_name='Grade'),
+        ),
+        migrations.AlterIndexTogether(
+            name='productsearchrecord',
+            index_together=set([('grade', 'carrier', 'price_excl_tax'), ('carrier', 'price_excl_tax')]),
+        ),
+        # copy the current values, records are only updated as products change.
+        migrations.RunSQL(
+            'UPDATE casearch_productsearchrecord r SET grade = LEFT(v.value_text, 128) '
+            'FROM catalogue_productattributevalue v '
+            'JOIN catalogue_productattribute a ON a.id = v.attribute_id '
+            "WHERE a.code = 'grade' AND v.product_id = r.product_id AND v.value_text <> '';",
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            'UPDATE casearch_productsearchrecord r SET carrier = LEFT(v.value_text, 128) '
+            'FROM catalogue_productattributevalue v '
+            'JOIN catalogue_productattribute a ON a.id = v.attribute_id '
+            "WHERE a.code = 'carrier' AND v.product_id = r.product_id AND v.value_text <> '';",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 16:28
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Every grade and carrier of a product rather than the first one, in
+    arrays with GIN indexes for the listing filters' overlap lookups.
+    """
+
+    dependencies = [
+        ('casearch', '0006_search_record_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productsearchrecord',
+            name='carriers',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=128), blank=True, default=list, size=None, verbose_name='Carriers'),
+        ),
+        migrations.AddField(
+            model_name='productsearchrecord',
+            name='grades',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=128), blank=True, default=list, size=None, verbose_name='Grades'),
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX casearch_productsearchrecord_grades_gin '
+            'ON casearch_productsearchrecord USING gin (grades);',
+            'DROP INDEX casearch_productsearchrecord_grades_gin;',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX casearch_productsearchrecord_carriers_gin '
+            'ON casearch_productsearchrecord USING gin (carriers);',
+            'DROP INDEX casearch_productsearchrecord_carriers_gin;',
+        ),
+        migrations.AlterIndexTogether(
+            name='productsearchrecord',
+            index_together=set([]),
+        ),
+        migrations.RemoveField(
+            model_name='productsearchrecord',
+            name='carrier',
+        ),
+        migrations.RemoveField(
+            model_name='productsearchrecord',
+            name='grade',
+        ),
+        # copy the current values, records are only updated as products change.
+        migrations.RunSQL(
+            'UPDATE casearch_productsearchrecord r SET grades = v.value_texts FROM ('
+            'SELECT v.product_id, array_agg(DISTINCT LEFT(v.value_text, 128)) AS value_texts '
+            'FROM catalogue_productattributevalue v '
+            'JOIN catalogue_productattribute a ON a.id = v.attribute_id '
+            "WHERE a.code = 'grade' AND v.value_text <> '' GROUP BY v.product_id"
+            ') v WHERE v.product_id = r.product_id;',
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            'UPDATE casearch_productsearchrecord r SET carriers = v.value_texts FROM ('
+            'SELECT v.product_id, array_agg(DISTINCT LEFT(v.value_text, 128)) AS value_texts '
+            'FROM catalogue_productattributevalue v '
+            'JOIN catalogue_productattribute a ON a.id = v.attribute_id '
+            "WHERE a.code = 'carrier' AND v.value_text <> '' GROUP BY v.product_id"
+            ') v WHERE v.product_id = r.product_id;',
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,5 +1,126 @@
 from __future__ import unicode_literals
 
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
+from django.utils.encoding import python_2_unicode_compatible
+from django.utils.translation import ugettext_lazy as _
+from oscar.core.loading import get_class
 
-# Create your models here.
+from casearch.fulltext import get_search_vector
+
+FACET_MAX_LENGTH = 128
+
+
+class ProductSearchRecordManager(models.Manager):
+
+    def get_values_for_product(self, product, strategy=None):
+        """
+        Return the denormalized column values for a product: its price as
+        the partner strategy prices it and its full-text search vector.
+        """
+        # loaded lazily, these modules are not ready when models load.
+        if strategy is None:
+            strategy = get_class('partner.strategy', 'Selector')().strategy()
+        facet_codes = get_class('search.utils', 'FACET_ATTRIBUTE_CODES')
+        price = strategy.fetch_for_product(product).price
+        attribute_values = [
+            (code, value) for code, value in product.attribute_values.filter(
+                attribute__code__in=facet_codes).values_list('attribute__code', 'value_text')
+            if value]
+        facets = dict((code, set()) for code in facet_codes)
+        for code, value in attribute_values:
+            # every value, a product may have several attributes of a code.
+            facets[code].add(value[:FACET_MAX_LENGTH])
+        return {
+            'price_excl_tax': price.excl_tax if price.exists else None,
+            'price_currency': price.currency or '',
+            'grades': sorted(facets['grade']),
+            'carriers': sorted(facets['carrier']),
+            'search_vector': get_search_vector(product, [v for code, v in attribute_values]),
+            'date_updated': timezone.now(),
+        }
+
+    def update_for_product(self, product, strategy=None, create=True):
+        """
+        Bring the search record of a product in sync with the product,
+        its stock records and attribute values.
+
+        Pass create=False to only touch an existing record, eg. while the
+        product itself might be in the middle of being deleted.
+        """
+        values = self.get_values_for_product(product, strategy)
+        updated = self.filter(product=product).update(**values)
+        if not updated and create:
+            self.create(product=product, **values)
+
+
+@python_2_unicode_compatible
+class ProductSearchRecord(models.Model):
+    """
+    Denormalized copy of the product data our search listings filter
+    and sort on, so they can do it in a single indexed query.
+
+    The price is the effective price the partner strategy reports for the
+    product. Grades and carriers are every value of the attributes of
+    those codes, searched with GIN indexes (see migration 0007). The
+    search vector covers the title, UPC, description and the grade/carrier
+    attribute values, with a GIN index for full-text search. All are kept
+    in sync by the signal receivers, so by the catalogue importer and the
+    dashboard saving attribute values too.
+    """
+    product = models.OneToOneField(
+        'catalogue.Product', primary_key=True,
+        related_name='search_record', on_delete=models.CASCADE)
+    price_excl_tax = models.DecimalField(
+        _("Price (excl. tax)"), decimal_places=2, max_digits=12,
+        blank=True, null=True, db_index=True)
+    price_currency = models.CharField(
+        _("Currency"), max_length=12, blank=True, default='')
+    grades = ArrayField(
+        models.CharField(max_length=FACET_MAX_LENGTH), verbose_name=_("Grades"),
+        blank=True, default=list)
+    carriers = ArrayField(
+        models.CharField(max_length=FACET_MAX_LENGTH), verbose_name=_("Carriers"),
+        blank=True, default=list)
+    search_vector = SearchVectorField(null=True, editable=False)
+    date_updated = models.DateTimeField(_("Date updated"), auto_now=True)
+
+    objects = ProductSearchRecordManager()
+
+    class Meta:
+        verbose_name = _('Product search record')
+        verbose_name_plural = _('Product search records')
+
+    def __str__(self):
+        return '%s - %s' % (self.product_id, self.price_excl_tax)
+
+
+class QueuedIndexUpdateManager(models.Manager):
+
+    def enqueue(self, product_id):
+        return self.create(product_id=product_id)
+
+
+@python_2_unicode_compatible
+class QueuedIndexUpdate(models.Model):
+    """
+    A product whose search index document needs refreshing.
+
+    Rows are written by the queued signal processor in the transaction of
+    the change, and removed once casearch_process_index_queue applied them.
+    The product id is not a foreign key, a deleted product must stay
+    queued to be removed from the index.
+    """
+    product_id = models.IntegerField(_("Product ID"), db_index=True)
+    date_queued = models.DateTimeField(_("Date queued"), auto_now_add=True)
+
+    objects = QueuedIndexUpdateManager()
+
+    class Meta:
+        verbose_name = _('Queued index update')
+        verbose_name_plural = _('Queued index updates')
+
+    def __str__(self):
+        return '%s - %s' % (self.product_id, self.date_queued)
@@ -0,0 +1,194 @@
+import hashlib
+import json
+from functools import reduce
+from operator import or_
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils import six
+from django.utils.encoding import force_bytes
+from django.utils.functional import cached_property
+
+from casearch.resultcache import get_catalogue_version
+
+CURSOR_SALT = 'casearch.pagination.cursor'
+APPROXIMATE_COUNT_CACHE_TIMEOUT = 60 * 60
+
+
+def estimate_count(queryset):
+    """
+    Return the number of rows the PostgreSQL planner expects the queryset
+    to return, or None on other databases.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) %s' % sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, six.string_types):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPage(Page):
+
+    def has_next(self):
+        if self.paginator.count_is_approximate:
+            # told by the extra row fetched, the count may be off.
+            return self.paginator.has_more.get(self.number, False)
+        return super(KeysetPage, self).has_next()
+
+    @cached_property
+    def next_cursor(self):
+        """
+        Opaque token for the row ending this page, to seek the next page
+        from instead of counting through an offset.
+        """
+        if not self.has_next() or not self.object_list:
+            return None
+        return self.paginator.get_cursor(self.object_list[-1], self.number)
+
+
+class KeysetPaginator(Paginator):
+    """
+    Paginator for ordered querysets, fetching only the rows of the
+    requested page plus a count.
+
+    Deep pages can be reached with the cursor of the page before them,
+    which seeks past the last row of that page using the ordering columns
+    instead of an OFFSET. Without a usable cursor it falls back to plain
+    offset pagination, so page numbers keep working as always.
+
+    The ordering is made total with the primary key, so both ways of
+    paging return the exact same rows.
+
+    With approximate_count_above set, result sets the planner expects to
+    be at least that large are not counted: the estimate is used instead,
+    cached per query until the catalogue changes so the number of pages
+    holds still while paging. Pages then fetch one extra row to tell
+    whether there is a next one, and any page number may be asked for.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True, cursor=None, approximate_count_above=None):
+        ordering = list(object_list.query.order_by) or list(object_list.model._meta.ordering)
+        if not any(f.lstrip('-') in ('pk', 'id') for f in ordering):
+            ordering.append('pk')
+            object_list = object_list.order_by(*ordering)
+        self.ordering = ordering
+        self.cursor = cursor
+        self.approximate_count_above = approximate_count_above
+        self.count_is_approximate = False
+        # page number to whether rows follow it, for approximate counts.
+        self.has_more = {}
+        super(KeysetPaginator, self).__init__(
+            object_list, per_page, orphans, allow_empty_first_page)
+
+    @cached_property
+    def count(self):
+        if self.approximate_count_above is None:
+            return super(KeysetPaginator, self).count
+        sql, params = self.object_list.order_by().query.sql_with_params()
+        cache_key = 'casearch.count.%s.%s' % (
+            hashlib.md5(force_bytes(sql) + force_bytes(repr(params))).hexdigest(),
+            get_catalogue_version())
+        estimate = cache.get(cache_key)
+        if estimate is None:
+            estimate = estimate_count(self.object_list)
+            if estimate is None:
+                return super(KeysetPaginator, self).count
+            cache.set(cache_key, estimate, APPROXIMATE_COUNT_CACHE_TIMEOUT)
+        if estimate < self.approximate_count_above:
+            return super(KeysetPaginator, self).count
+        self.count_is_approximate = True
+        return estimate
+
+    def validate_number(self, number):
+        if not self.count_is_approximate:
+            return super(KeysetPaginator, self).validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        # counting first decides how the page is validated and sliced.
+        self.count
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if self.count_is_approximate:
+            top += 1
+        elif top + self.orphans >= self.count:
+            top = self.count
+        seek = self.get_seek_filter(number)
+        if seek is not None:
+            object_list = self.object_list.filter(seek)[:top - bottom]
+        else:
+            object_list = self.object_list[bottom:top]
+        object_list = list(object_list)
+        if self.count_is_approximate:
+            if not object_list and number > 1:
+                raise EmptyPage('That page contains no results')
+            self.has_more[number] = len(object_list) > self.per_page
+            object_list = object_list[:self.per_page]
+        return self._get_page(object_list, number, self)
+
+    def _get_page(self, *args, **kwargs):
+        return KeysetPage(*args, **kwargs)
+
+    @property
+    def fields(self):
+        return [f.lstrip('-') for f in self.ordering]
+
+    def get_cursor(self, obj, number):
+        values = self.object_list.filter(pk=obj.pk).values_list(*self.fields)[0]
+        return signing.dumps({
+            'page': number,
+            'ordering': self.ordering,
+            # json friendly, the lookups convert them back.
+            'values': [
+                v if v is None or isinstance(v, six.integer_types + (float,)) else six.text_type(v)
+                for v in values],
+        }, salt=CURSOR_SALT, compress=True)
+
+    def get_seek_filter(self, number):
+        """
+        Return the filter selecting the rows after the cursor, if the
+        cursor ends the page right before the requested one.
+        """
+        if not self.cursor:
+            return None
+        try:
+            cursor = signing.loads(self.cursor, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            return None
+        if cursor.get('page') != number - 1 or cursor.get('ordering') != self.ordering:
+            return None
+
+        # rows after the cursor share its leading columns and come later
+        # on the first one that differs. A column that can be NULL needs a
+        # column before it grouping the NULLs together, as order_by_price
+        # does, so a NULL is only ever compared against other NULLs.
+        clauses = []
+        equal = {}
+        for field, value in zip(self.ordering, cursor['values']):
+            name = field.lstrip('-')
+            descending = field.startswith('-')
+            if value is None:
+                equal['%s__isnull' % name] = True
+                continue
+            lookup = '%s__lt' % name if descending else '%s__gt' % name
+            clauses.append(Q(**equal) & Q(**{lookup: value}))
+            equal[name] = value
+        if not clauses:
+            return None
+        return reduce(or_, clauses)
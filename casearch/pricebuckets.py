@@ -0,0 +1,138 @@
+from bisect import bisect_right
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from casearch.bitmaps import Bitmap
+from casearch.models import ProductSearchRecord
+
+PRICE_BUCKETS_CACHE_KEY = 'casearch.price_buckets'
+PRICE_BOUNDARIES_CACHE_KEY = 'casearch.price_boundaries'
+
+
+def _get_timeout():
+    return getattr(settings, 'CASEARCH_PRICE_BUCKETS_CACHE_TIMEOUT', 60 * 60 * 6)
+
+
+def _get_prices(**filters):
+    return ProductSearchRecord.objects.filter(
+        product__parent__isnull=True,
+        price_excl_tax__isnull=False,
+        **filters
+    ).values_list('product_id', 'price_excl_tax')
+
+
+def round_boundary(price):
+    """
+    Round a price down to two significant digits, eg. 137.45 to 130, so
+    the buckets read as round figures.
+    """
+    price = int(price)
+    if price < 10:
+        return Decimal(price)
+    unit = 10 ** (len(str(price)) - 2)
+    return Decimal(price // unit * unit)
+
+
+def get_boundaries(prices, count):
+    """
+    Return the rounded prices splitting the sorted prices into up to count
+    buckets with about as many products each.
+    """
+    boundaries = []
+    if not prices:
+        return boundaries
+    for i in range(1, count):
+        boundary = round_boundary(prices[i * len(prices) // count])
+        # rounding may leave nothing below, or merge two quantiles.
+        if boundary > prices[0] and (not boundaries or boundary > boundaries[-1]):
+            boundaries.append(boundary)
+    return boundaries
+
+
+def build_price_buckets(count=None, boundaries=None):
+    """
+    Return the price buckets of the browsable products as a list of dicts
+    with the min and max price, None when open ended, the number of
+    products and the bitmap of their ids. A bucket holds min <= price < max.
+
+    The boundaries, unless given, are quantiles of the current prices, so
+    every bucket holds a similar share of the catalogue. Either way the
+    prices are read with one query.
+    """
+    if count is None:
+        count = getattr(settings, 'CASEARCH_PRICE_BUCKETS', 8)
+    prices = sorted(_get_prices(), key=lambda p: p[1])
+    if boundaries is None:
+        boundaries = get_boundaries([price for pk, price in prices], count)
+    ids = [[] for i in range(len(boundaries) + 1)]
+    for pk, price in prices:
+        ids[bisect_right(boundaries, price)].append(pk)
+    bounds = [None] + list(boundaries) + [None]
+    return [
+        {'min': bounds[i], 'max': bounds[i + 1], 'count': len(pks), 'ids': Bitmap.from_ids(pks)}
+        for i, pks in enumerate(ids)]
+
+
+def _dumps(buckets):
+    return [dict(bucket, ids=bucket['ids'].to_bytes()) for bucket in buckets]
+
+
+def _loads(data):
+    return [dict(bucket, ids=Bitmap.from_bytes(bucket['ids'])) for bucket in data]
+
+
+def set_price_buckets(buckets):
+    cache.set_many({
+        PRICE_BUCKETS_CACHE_KEY: _dumps(buckets),
+        PRICE_BOUNDARIES_CACHE_KEY: [bucket['min'] for bucket in buckets[1:]],
+    }, _get_timeout())
+
+
+def get_price_boundaries():
+    """
+    Return the prices splitting the buckets, cached apart from the
+    buckets so showing the ranges never decodes their bitmaps.
+    """
+    boundaries = cache.get(PRICE_BOUNDARIES_CACHE_KEY)
+    if boundaries is None:
+        boundaries = [bucket['min'] for bucket in get_price_buckets()[1:]]
+    return boundaries
+
+
+def get_price_buckets():
+    """
+    Return the price buckets, kept in the shared cache. The boundaries are
+    recomputed when they expire, or by casearch_update_price_buckets, and
+    kept while the buckets are rebuilt after prices change.
+    """
+    data = cache.get(PRICE_BUCKETS_CACHE_KEY)
+    if data is not None:
+        return _loads(data)
+    buckets = build_price_buckets(boundaries=cache.get(PRICE_BOUNDARIES_CACHE_KEY))
+    set_price_buckets(buckets)
+    return buckets
+
+
+def invalidate_price_buckets():
+    """
+    Drop the cached buckets after a price changed, the next read builds
+    them again with its single query.
+    """
+    cache.delete(PRICE_BUCKETS_CACHE_KEY)
+    # again once committed, in case a read rebuilt them meanwhile from the
+    # prices as they were.
+    transaction.on_commit(lambda: cache.delete(PRICE_BUCKETS_CACHE_KEY))
+
+
+def count_price_buckets(product_ids):
+    """
+    Return (min, max, count) for every price bucket, counting only the
+    given products.
+    """
+    results = Bitmap.from_ids(product_ids)
+    return [
+        (bucket['min'], bucket['max'], len(bucket['ids'] & results))
+        for bucket in get_price_buckets()]
@@ -0,0 +1,78 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from oscar.core.loading import get_model
+
+from casearch.facets import invalidate_facet_bitmaps
+from casearch.models import ProductSearchRecord
+from casearch.pricebuckets import invalidate_price_buckets
+from casearch.resultcache import bump_catalogue_version
+
+Product = get_model('catalogue', 'Product')
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+StockRecord = get_model('partner', 'StockRecord')
+
+
+@receiver(post_save, sender=StockRecord)
+def update_search_record_on_stockrecord_save(sender, instance, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    ProductSearchRecord.objects.update_for_product(instance.product)
+
+
+@receiver(post_delete, sender=StockRecord)
+def update_search_record_on_stockrecord_delete(sender, instance, **kwargs):
+    # the product may be getting deleted along with its stock records,
+    # so never create a record here and do not trust the cached relation.
+    product = Product.objects.filter(pk=instance.product_id).first()
+    if product is not None:
+        ProductSearchRecord.objects.update_for_product(product, create=False)
+
+
+@receiver(post_save, sender=Product)
+def update_search_record_on_product_save(sender, instance, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    ProductSearchRecord.objects.update_for_product(instance)
+
+
+@receiver(post_save, sender=ProductAttributeValue)
+def update_search_record_on_attribute_save(sender, instance, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    ProductSearchRecord.objects.update_for_product(instance.product)
+
+
+@receiver(post_delete, sender=ProductAttributeValue)
+def update_search_record_on_attribute_delete(sender, instance, **kwargs):
+    # same as for stock records, the product may be on its way out.
+    product = Product.objects.filter(pk=instance.product_id).first()
+    if product is not None:
+        ProductSearchRecord.objects.update_for_product(product, create=False)
+
+
+@receiver(post_save, sender=ProductAttributeValue)
+@receiver(post_delete, sender=ProductAttributeValue)
+def invalidate_facet_bitmaps_on_attribute_change(sender, instance, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    invalidate_facet_bitmaps()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=StockRecord)
+@receiver(post_delete, sender=StockRecord)
+def invalidate_price_buckets_on_price_change(sender, instance, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    invalidate_price_buckets()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=StockRecord)
+@receiver(post_delete, sender=StockRecord)
+@receiver(post_save, sender=ProductAttributeValue)
+@receiver(post_delete, sender=ProductAttributeValue)
+def bump_catalogue_version_on_change(sender, instance, **kwargs):
+    # cached search results are of an older catalogue now.
+    bump_catalogue_version()
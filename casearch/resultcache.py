@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from casearch.utils import normalize_search_params
+
+CATALOGUE_VERSION_CACHE_KEY = 'casearch.catalogue_version'
+
+
+def get_catalogue_version():
+    """
+    Return the catalogue version, bumped on every product, stock or
+    attribute change. Kept in the shared cache so every process sees it.
+    """
+    version = cache.get(CATALOGUE_VERSION_CACHE_KEY)
+    if version is None:
+        version = 1
+        cache.add(CATALOGUE_VERSION_CACHE_KEY, version, None)
+    return version
+
+
+def bump_catalogue_version():
+    try:
+        cache.incr(CATALOGUE_VERSION_CACHE_KEY)
+    except ValueError:
+        # not set yet, or evicted.
+        cache.set(CATALOGUE_VERSION_CACHE_KEY, 2, None)
+
+
+def get_result_cache_key(request_data):
+    return tuple(
+        (name, tuple(value) if isinstance(value, list) else value)
+        for name, value in normalize_search_params(request_data).items())
+
+
+class ResultCache(object):
+    """
+    Per process LRU cache of the ordered product ids of searches, dropping
+    the entries of older catalogue versions.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None or entry[0] != version:
+                return None
+            # most recently used last.
+            self.entries[key] = entry
+            return entry[1]
+
+    def set(self, key, version, ids):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (version, tuple(ids))
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+result_cache = ResultCache(getattr(settings, 'CASEARCH_RESULT_CACHE_SIZE', 256))
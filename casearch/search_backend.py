@@ -0,0 +1,265 @@
+"""
+Haystack backend searching the in-process inverted index of
+casearch.invertedindex, for deployments without Solr.
+
+Queries use the subset of the Solr syntax Oscar's haystack search issues:
+words, `field:"value"`, `field:("a" OR "b")`, `field:[low TO high]` and
+NOT/- exclusions, all clauses combined with AND. Words are matched as
+prefixes, like the postgres full-text search.
+"""
+import re
+
+from django.utils import six
+from django.utils.encoding import force_text
+from haystack.backends import BaseEngine, BaseSearchBackend, BaseSearchQuery, log_query
+from haystack.constants import DJANGO_CT, DJANGO_ID
+from haystack.inputs import PythonData
+from haystack.models import SearchResult
+from haystack.utils import get_model_ct
+
+from casearch.bitmaps import Bitmap
+from casearch.invertedindex import (
+    DEFAULT_MERGE_THRESHOLD, Document, InvertedIndex, tokenize)
+
+# facet field suffix haystack adds, the index stores values by base field.
+EXACT_SUFFIX = '_exact'
+
+CLAUSE_RE = re.compile(r'''
+    (?P<negated>-|NOT\s+)?
+    (?:
+        (?P<field>\w+):
+        (?:
+            "(?P<value>(?:[^"\\]|\\.)*)"
+            | \[(?P<low>\S+)\s+TO\s+(?P<high>\S+)\]
+            | \((?P<values>[^)]*)\)
+            | (?P<bare>[^\s()]+)
+        )
+        | "(?P<phrase>(?:[^"\\]|\\.)*)"
+        | (?P<word>[^\s()]+)
+    )''', re.VERBOSE | re.UNICODE)
+QUOTED_RE = re.compile(r'"((?:[^"\\]|\\.)*)"', re.UNICODE)
+ESCAPE_RE = re.compile(r'\\(.)', re.UNICODE)
+OPERATORS = ('AND', 'OR', '&&', '||')
+
+# one index per path in each process, reopened only when a writer changed it.
+_indexes = {}
+
+
+def get_index(path, merge_threshold):
+    if path not in _indexes:
+        _indexes[path] = InvertedIndex(path, merge_threshold)
+    return _indexes[path]
+
+
+def unescape(value):
+    return ESCAPE_RE.sub(r'\1', value)
+
+
+def base_field(field):
+    if field.endswith(EXACT_SUFFIX):
+        return field[:-len(EXACT_SUFFIX)]
+    return field
+
+
+def parse_bound(value):
+    if value == '*':
+        return None
+    return float(unescape(value))
+
+
+class InvertedIndexSearchBackend(BaseSearchBackend):
+    RESERVED_WORDS = ('AND', 'NOT', 'OR', 'TO')
+    RESERVED_CHARACTERS = ('\\', '"', '(', ')', '[', ']', ':')
+
+    def __init__(self, connection_alias, **connection_options):
+        super(InvertedIndexSearchBackend, self).__init__(connection_alias, **connection_options)
+        self.path = connection_options['PATH']
+        self.merge_threshold = connection_options.get('MERGE_THRESHOLD', DEFAULT_MERGE_THRESHOLD)
+        self.price_field = connection_options.get('PRICE_FIELD', 'price')
+
+    @property
+    def index(self):
+        return get_index(self.path, self.merge_threshold)
+
+    def update(self, index, iterable, commit=True):
+        self.index.add([self.get_document(index, obj) for obj in iterable])
+
+    def get_document(self, index, obj):
+        data = index.full_prepare(obj)
+        facets = {DJANGO_CT: [data[DJANGO_CT]]}
+        for field_name, field in index.fields.items():
+            # string facets only, they are what gets narrowed on.
+            if not getattr(field, 'facet_for', None) or field.field_type != 'string':
+                continue
+            values = data.get(field.index_fieldname)
+            if values is None:
+                continue
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+            facets[base_field(field_name)] = sorted(set(force_text(v) for v in values))
+        price = data.get(self.price_field)
+        return Document(
+            data[DJANGO_CT], data[DJANGO_ID],
+            terms=tokenize(data.get(index.get_content_field()) or ''),
+            facets=facets,
+            price=float(price) if price is not None else None)
+
+    def remove(self, obj_or_string, commit=True):
+        if isinstance(obj_or_string, six.string_types):
+            # 'app_label.model_name.pk'
+            app_label, model_name, pk = obj_or_string.split('.', 2)
+            key = ('%s.%s' % (app_label, model_name), pk)
+        else:
+            key = (get_model_ct(obj_or_string), obj_or_string.pk)
+        self.index.remove([(key[0], int(key[1]))])
+
+    def clear(self, models=None, commit=True):
+        content_types = None
+        if models is not None:
+            content_types = set(get_model_ct(model) for model in models)
+        self.index.clear(content_types)
+
+    @log_query
+    def search(self, query_string, sort_by=None, start_offset=0, end_offset=None,
+               facets=None, query_facets=None, narrow_queries=None, models=None,
+               limit_to_registered_models=None, result_class=None, **kwargs):
+        snapshot = self.index.refresh()
+        result_class = result_class or SearchResult
+
+        matches = self.match(snapshot, query_string)
+        for narrow_query in narrow_queries or ():
+            matches = matches & self.match(snapshot, narrow_query)
+
+        if models is None and limit_to_registered_models is not False:
+            models = self.build_models_list() or None
+        elif models is not None:
+            models = [get_model_ct(model) for model in models]
+        if models:
+            matches = matches & six.moves.reduce(
+                lambda a, b: a | b, (snapshot.facet(DJANGO_CT, ct) for ct in models))
+
+        facet_counts = {}
+        if facets or query_facets:
+            facet_counts = self.get_facet_counts(snapshot, matches, facets, query_facets)
+
+        sort_by_price = None
+        for field in sort_by or ():
+            # the other orderings are not kept in the index, they fall
+            # back to index order (newest first).
+            if base_field(field.lstrip('-')) == self.price_field:
+                sort_by_price = 'desc' if field.startswith('-') else 'asc'
+                break
+
+        results = []
+        ordered = snapshot.ordered(matches, sort_by_price, end_offset)
+        for position, docno in enumerate(ordered):
+            if end_offset is not None and position >= end_offset:
+                break
+            if position < start_offset:
+                continue
+            content_type, pk = snapshot.key(docno)
+            app_label, model_name = content_type.split('.')
+            results.append(result_class(app_label, model_name, pk, 1.0))
+
+        return {
+            'results': results,
+            'hits': len(matches),
+            'facets': facet_counts,
+            'spelling_suggestion': None,
+        }
+
+    def match(self, snapshot, query_string):
+        """
+        Return the bitmap of the documents matching every clause.
+        """
+        query_string = query_string.strip()
+        matches = snapshot.all()
+        if query_string in ('', '*', '*:*'):
+            return matches
+        for clause in CLAUSE_RE.finditer(query_string):
+            if clause.group('word') in OPERATORS:
+                continue
+            bits = self.match_clause(snapshot, clause)
+            if clause.group('negated'):
+                matches = matches - bits
+            else:
+                matches = matches & bits
+        return matches
+
+    def match_clause(self, snapshot, clause):
+        field = clause.group('field')
+        if field is None or field == 'content':
+            text = clause.group('phrase') or clause.group('word') or clause.group('value') or clause.group('bare')
+            return self.match_words(snapshot, unescape(text or ''))
+        field = base_field(field)
+
+        if clause.group('low') is not None:
+            low, high = parse_bound(clause.group('low')), parse_bound(clause.group('high'))
+            if field == self.price_field:
+                return snapshot.price_range(low, high)
+            return Bitmap()
+
+        if clause.group('values') is not None:
+            values = [unescape(v) for v in QUOTED_RE.findall(clause.group('values'))]
+        else:
+            values = [unescape(clause.group('value') or clause.group('bare'))]
+        if field in snapshot.segment.facet_sections or field in snapshot.delta.facet_sections:
+            return six.moves.reduce(
+                lambda a, b: a | b, (snapshot.facet(field, v) for v in values), Bitmap())
+        # not a facet, look for the words in the text instead.
+        return six.moves.reduce(
+            lambda a, b: a | b, (self.match_words(snapshot, v) for v in values), Bitmap())
+
+    def match_words(self, snapshot, text):
+        matches = snapshot.all()
+        for word in tokenize(text):
+            matches = matches & snapshot.prefix(word)
+        return matches
+
+    def get_facet_counts(self, snapshot, matches, facets, query_facets):
+        fields = {}
+        for field in facets or ():
+            counts = [
+                (value, len(snapshot.facet(base_field(field), value) & matches))
+                for value in snapshot.facet_values(base_field(field))]
+            fields[field] = sorted(counts, key=lambda c: (-c[1], c[0]))
+
+        queries = {}
+        for field, query in query_facets or ():
+            query_string = '%s:%s' % (field, query)
+            queries[query_string] = len(self.match(snapshot, query_string) & matches)
+
+        return {'fields': fields, 'queries': queries, 'dates': {}}
+
+    def prep_value(self, value):
+        return force_text(value)
+
+
+class InvertedIndexSearchQuery(BaseSearchQuery):
+
+    def matching_all_fragment(self):
+        return '*:*'
+
+    def build_query_fragment(self, field, filter_type, value):
+        if not hasattr(value, 'input_type_name'):
+            value = PythonData(value)
+        prepared = value.prepare(self)
+
+        if field == 'content':
+            return force_text(prepared)
+        if filter_type == 'in':
+            return '%s:(%s)' % (field, ' OR '.join(
+                '"%s"' % self.clean(force_text(v)) for v in prepared))
+        if filter_type == 'range':
+            return '%s:[%s TO %s]' % (field, prepared[0], prepared[1])
+        # the price column only answers inclusive ranges.
+        if filter_type in ('gt', 'gte'):
+            return '%s:[%s TO *]' % (field, prepared)
+        if filter_type in ('lt', 'lte'):
+            return '%s:[* TO %s]' % (field, prepared)
+        return '%s:"%s"' % (field, self.clean(force_text(prepared)))
+
+
+class InvertedIndexEngine(BaseEngine):
+    backend = InvertedIndexSearchBackend
+    query = InvertedIndexSearchQuery
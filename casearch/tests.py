@@ -1,3 +1,301 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import PermissionDenied
+from django.db import connection
+from django.http import Http404, QueryDict
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from oscar.core.loading import get_model
+
+from casearch.bitmaps import Bitmap
+from casearch.feeds import CSVFeed, Feed
+from casearch.instrumentation import SearchProfile
+from casearch.invertedindex import Document, InvertedIndex, Segment, build_segment, tokenize
+from casearch.search_backend import InvertedIndexSearchBackend
+from casearch.utils import filter_by_attributes
+from casearch.views import ExportView, FeedView
+
+CT = 'catalogue.product'
+
+
+def make_document(pk, text='', price=None, **facets):
+    return Document(CT, pk, tokenize(text), dict((k, [v]) for k, v in facets.items()), price)
+
+
+class SegmentTest(SimpleTestCase):
+
+    def setUp(self):
+        self.segment = Segment(build_segment([
+            make_document(1, 'apple iphone', 100.0, grade='A'),
+            make_document(2, 'samsung galaxy', 50.0, grade='B'),
+            make_document(3, 'apple ipad', None, grade='A'),
+        ]))
+
+    def keys(self, docnos):
+        return sorted(self.segment.key(docno)[1] for docno in docnos)
+
+    def test_documents_are_numbered_newest_first(self):
+        self.assertEqual([self.segment.key(docno)[1] for docno in range(3)], [3, 2, 1])
+        self.assertEqual(self.segment.find((CT, 2)), 1)
+        self.assertIsNone(self.segment.find((CT, 4)))
+        self.assertIsNone(self.segment.find(('catalogue.category', 2)))
+
+    def test_prefix(self):
+        self.assertEqual(self.keys(self.segment.prefix('app')), [1, 3])
+        self.assertEqual(self.keys(self.segment.prefix('galaxy')), [2])
+        self.assertEqual(self.keys(self.segment.prefix('nokia')), [])
+
+    def test_facet(self):
+        self.assertEqual(self.keys(self.segment.facet('grade', 'A')), [1, 3])
+        self.assertEqual(self.keys(self.segment.facet('grade', 'C')), [])
+        self.assertEqual(sorted(self.segment.facet_values('grade')), ['A', 'B'])
+
+    def test_price_range(self):
+        self.assertEqual(self.keys(self.segment.price_range(60, None)), [1])
+        self.assertEqual(self.keys(self.segment.price_range(None, 100)), [1, 2])
+        self.assertEqual(self.keys(self.segment.price_range()), [1, 2])
+        self.assertEqual(
+            [(price, self.segment.key(docno)[1]) for price, docno in self.segment.by_price()],
+            [(50.0, 2), (100.0, 1)])
+
+    def test_documents_round_trip(self):
+        documents = dict((doc.pk, doc) for doc in self.segment.documents())
+        self.assertEqual(documents[1].terms, set(['apple', 'iphone']))
+        self.assertEqual(documents[1].facets, {'grade': ['A']})
+        self.assertEqual(documents[1].price, 100.0)
+        self.assertIsNone(documents[3].price)
+
+    def test_not_a_segment(self):
+        with self.assertRaises(ValueError):
+            Segment(b'NOTASEGM' + b'\0' * 8)
+
+
+class InvertedIndexTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = InvertedIndex('%s/index' % self.directory, merge_threshold=10)
+        self.index.rebuild([
+            make_document(1, 'apple iphone', 100.0, grade='A'),
+            make_document(2, 'samsung galaxy', 50.0, grade='B'),
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def pks(self, bitmap):
+        snapshot = self.index.refresh()
+        return sorted(snapshot.key(docno)[1] for docno in bitmap)
+
+    def test_delta_overlays_segment(self):
+        self.index.add([make_document(2, 'samsung note', 60.0, grade='A'), make_document(3, 'apple ipad')])
+        self.index.remove([(CT, 1)])
+        snapshot = self.index.refresh()
+        self.assertEqual(snapshot.pending, 4)
+        self.assertEqual(self.pks(snapshot.all()), [2, 3])
+        self.assertEqual(self.pks(snapshot.prefix('galaxy')), [])
+        self.assertEqual(self.pks(snapshot.prefix('note')), [2])
+        self.assertEqual(self.pks(snapshot.facet('grade', 'A')), [2])
+        self.assertEqual(self.pks(snapshot.price_range(55, None)), [2])
+
+    def test_delta_replays_in_order(self):
+        self.index.remove([(CT, 2)])
+        self.index.add([make_document(2, 'samsung note')])
+        self.assertEqual(self.pks(self.index.refresh().prefix('note')), [2])
+        self.index.remove([(CT, 2)])
+        self.assertEqual(self.pks(self.index.refresh().all()), [1])
+
+    def test_merge_folds_delta_into_segment(self):
+        self.index.add([make_document(pk, 'phone %d' % pk) for pk in range(3, 13)])
+        snapshot = self.index.refresh()
+        self.assertEqual(snapshot.pending, 0)
+        self.assertEqual(snapshot.segment.doc_count, 12)
+        self.assertEqual(self.pks(snapshot.prefix('phone')), list(range(3, 13)))
+
+    def test_other_instances_see_writes(self):
+        reader = InvertedIndex(self.index.path)
+        self.assertEqual(reader.refresh().doc_count, 2)
+        self.index.add([make_document(3, 'apple ipad')])
+        self.assertEqual(reader.refresh().doc_count, 3)
+
+    def test_clear_content_types(self):
+        self.index.add([Document('catalogue.category', 1, ['phones'])])
+        self.index.clear(set([CT]))
+        snapshot = self.index.refresh()
+        self.assertEqual([snapshot.key(docno) for docno in snapshot.all()], [('catalogue.category', 1)])
+
+
+class QueryTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.backend = InvertedIndexSearchBackend('default', PATH='%s/index' % self.directory)
+        self.index = InvertedIndex(self.backend.path)
+        self.index.rebuild([
+            make_document(1, 'Apple iPhone 7', 300.0, grade='A', carrier='Verizon'),
+            make_document(2, 'Samsung Galaxy S8', 250.0, grade='B', carrier='AT&T'),
+            make_document(3, 'Apple iPhone 6', 150.0, grade='B', carrier='Verizon'),
+            make_document(4, 'Google "Pixel"', None, grade='C', carrier='Sprint'),
+        ])
+        self.snapshot = self.index.refresh()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def match(self, query_string):
+        return sorted(
+            self.snapshot.key(docno)[1] for docno in self.backend.match(self.snapshot, query_string))
+
+    def test_match_all(self):
+        self.assertEqual(self.match(''), [1, 2, 3, 4])
+        self.assertEqual(self.match('*:*'), [1, 2, 3, 4])
+
+    def test_words_are_prefixes(self):
+        self.assertEqual(self.match('iph'), [1, 3])
+        self.assertEqual(self.match('apple iphone 7'), [1])
+        self.assertEqual(self.match('apple AND 6'), [3])
+        self.assertEqual(self.match('content:galaxy'), [2])
+
+    def test_facet_values(self):
+        self.assertEqual(self.match('grade_exact:"B"'), [2, 3])
+        self.assertEqual(self.match('carrier_exact:("AT&T" OR "Sprint")'), [2, 4])
+        self.assertEqual(self.match('grade:B carrier:Verizon'), [3])
+
+    def test_price_ranges(self):
+        self.assertEqual(self.match('price:[200 TO *]'), [1, 2])
+        self.assertEqual(self.match('price:[* TO 250]'), [2, 3])
+        self.assertEqual(self.match('price:[150 TO 250]'), [2, 3])
+
+    def test_negation(self):
+        self.assertEqual(self.match('apple -grade:"A"'), [3])
+        self.assertEqual(self.match('NOT carrier:"Verizon"'), [2, 4])
+
+    def test_escaped_quotes(self):
+        self.assertEqual(self.match(r'"\"pixel\""'), [4])
+
+    def test_unknown_field_matches_words(self):
+        self.assertEqual(self.match('title:"galaxy"'), [2])
+        self.assertEqual(self.match('rating:[1 TO 5]'), [])
+
+    def test_results_are_paged_in_price_order(self):
+        results = self.backend.search(
+            '*:*', sort_by=['price'], start_offset=1, end_offset=3, limit_to_registered_models=False)
+        self.assertEqual([int(r.pk) for r in results['results']], [2, 1])
+        self.assertEqual(results['hits'], 4)
+
+
+class BitmapTest(SimpleTestCase):
+
+    def test_bytes_round_trip(self):
+        bitmap = Bitmap.from_ids([0, 7, 8, 200])
+        self.assertEqual(list(Bitmap.from_bytes(bitmap.to_bytes())), [0, 7, 8, 200])
+
+
+class PriceOrderTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = InvertedIndex('%s/index' % self.directory)
+        self.index.rebuild([make_document(pk, 'phone', float(pk % 3)) for pk in range(1, 101)])
+        # some in the delta too.
+        self.index.add([make_document(pk, 'phone', float(pk % 3)) for pk in range(101, 111)])
+        self.snapshot = self.index.refresh()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_walk_and_heap_agree(self):
+        matches = self.snapshot.prefix('phone') - Bitmap.from_ids(range(0, 110, 2))
+        for sort_by_price in ('asc', 'desc'):
+            walk = list(self.snapshot.ordered(matches, sort_by_price))
+            heap = list(self.snapshot.top_by_price(matches, sort_by_price == 'desc', len(matches)))
+            self.assertEqual(walk, heap)
+            self.assertEqual(len(set(walk)), len(matches))
+
+    def test_pages_do_not_overlap(self):
+        matches = self.snapshot.prefix('phone') - Bitmap.from_ids(range(0, 110, 2))
+        seen = []
+        for end_offset in range(10, len(matches) + 10, 10):
+            ordered = list(self.snapshot.ordered(matches, 'desc', end_offset))
+            seen.extend(ordered[end_offset - 10:end_offset])
+        self.assertEqual(sorted(seen), sorted(matches))
+
+
+class SearchProfileTest(SimpleTestCase):
+
+    @override_settings(DEBUG=False, CASEARCH_QUERY_COUNT_SAMPLE_RATE=0)
+    def test_queries_not_counted_unless_sampled(self):
+        profile = SearchProfile('test', QueryDict(''))
+        with profile.stage('query'):
+            self.assertFalse(connection.force_debug_cursor)
+        stats = profile.as_dict(0)
+        self.assertIsNone(stats['queries'])
+        self.assertIsNone(stats['stages']['query']['queries'])
+
+    @override_settings(DEBUG=False, CASEARCH_QUERY_COUNT_SAMPLE_RATE=1)
+    def test_sampled_searches_count_queries(self):
+        profile = SearchProfile('test', QueryDict(''))
+        with profile.stage('query'):
+            self.assertTrue(connection.force_debug_cursor)
+        self.assertFalse(connection.force_debug_cursor)
+        self.assertEqual(profile.as_dict(0)['stages']['query']['queries'], 0)
+
+
+class FilterByAttributesTest(SimpleTestCase):
+
+    def test_any_of_the_record_values_matches(self):
+        products = filter_by_attributes(
+            get_model('catalogue', 'Product').objects.all(), {'grade': ['A', 'B'], 'carrier': []})
+        sql = str(products.query)
+        self.assertIn('"casearch_productsearchrecord"."grades" && ', sql)
+        self.assertNotIn('carriers', sql)
+
+
+class ExportViewTest(SimpleTestCase):
+
+    def get(self, user):
+        request = RequestFactory().get('/search/export/')
+        request.user = user
+        return ExportView.as_view()(request)
+
+    def test_anonymous_request_is_refused(self):
+        with self.assertRaises(PermissionDenied):
+            self.get(AnonymousUser())
+
+    def test_signed_in_customer_gets_the_stream(self):
+        # streamed lazily, nothing is read until the response is.
+        response = self.get(get_model('auth', 'User')(pk=1, username='buyer'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+
+class FeedViewTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.makedirs(CSVFeed.get_root(self.directory))
+        with open(os.path.join(CSVFeed.get_root(self.directory), 'manifest.json'), 'w') as f:
+            f.write('{}')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get(self, filename):
+        with self.settings(CASEARCH_FEEDS_ROOT=self.directory):
+            return FeedView.as_view()(RequestFactory().get('/'), feed='csv', filename=filename)
+
+    def test_serves_files_without_building_the_feed(self):
+        # no queries in a SimpleTestCase, the site is not looked up.
+        response = self.get('manifest.json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(b''.join(response.streaming_content), b'{}')
+
+    def test_missing_file(self):
+        with self.assertRaises(Http404):
+            self.get('csv-9.csv.gz')
+
+    def test_formats_define_entry(self):
+        with self.assertRaises(TypeError):
+            Feed()
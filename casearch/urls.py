@@ -3,5 +3,9 @@ from casearch import views
 
 
 urlpatterns = [
+    url(r'^suggest/$', views.SuggestView.as_view(), name='suggest'),
+    url(r'^export/$', views.ExportView.as_view(), name='export'),
+    url(r'^feeds/(?P<feed>csv|google|sitemap)/(?P<filename>[\w-]+(?:\.\w+)*)$',
+        views.FeedView.as_view(), name='feed'),
     url(r'', views.IndexView.as_view(), name='index')
 ]
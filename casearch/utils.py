@@ -1,2 +1,82 @@
-def get_price_range_tuple(start=500, step=500, end=50000):
-    return list(zip(xrange(start, (end + step), step), xrange(start, (end + step), step)))
+from collections import OrderedDict
+
+from django.db.models import Case, IntegerField, Value, When
+from oscar.core.loading import get_model
+
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+
+# effective price of a product, denormalized in ProductSearchRecord.
+PRICE_FIELD = 'search_record__price_excl_tax'
+# attribute codes copied onto ProductSearchRecord.
+# attribute codes to their search record columns.
+SEARCH_RECORD_FACETS = {'grade': 'grades', 'carrier': 'carriers'}
+
+
+def filter_by_price(queryset, min_price=None, max_price=None):
+    """
+    Restrict a product queryset to a price range.
+
+    Products with an unknown price are excluded once any bound is given.
+    """
+    if min_price or max_price:
+        queryset = queryset.filter(**{'%s__isnull' % PRICE_FIELD: False})
+    if min_price:
+        queryset = queryset.filter(**{'%s__gte' % PRICE_FIELD: min_price})
+    if max_price:
+        queryset = queryset.filter(**{'%s__lte' % PRICE_FIELD: max_price})
+    return queryset
+
+
+def filter_by_attributes(queryset, attribute_values):
+    """
+    Restrict a product queryset to the products having one of the given
+    values for each attribute code, eg. {'grade': ['A', 'B']}.
+
+    Grade and carrier are read from their indexed copies on the search
+    record, a product matching if any of its values is given. Every
+    other code is its own semi-join on the attribute values of that code,
+    so a grade never matches a carrier value and adding facets adds no
+    joined rows.
+    """
+    for code, values in attribute_values.items():
+        if not values:
+            continue
+        if code in SEARCH_RECORD_FACETS:
+            queryset = queryset.filter(
+                **{'search_record__%s__overlap' % SEARCH_RECORD_FACETS[code]: list(values)})
+        else:
+            queryset = queryset.filter(pk__in=ProductAttributeValue.objects.filter(
+                attribute__code=code, value_text__in=values).values('product_id'))
+    return queryset
+
+
+def order_by_price(queryset, sort_by):
+    """
+    Order a product queryset by price, ascending for 'price' and
+    descending for '-price'.
+
+    Products with an unknown price come first when ascending and last
+    when descending, the way the listings always sorted them.
+    """
+    queryset = queryset.annotate(
+        price_known=Case(
+            When(**{'%s__isnull' % PRICE_FIELD: True, 'then': Value(0)}),
+            default=Value(1), output_field=IntegerField()))
+    if sort_by.startswith('-'):
+        return queryset.order_by('-price_known', '-%s' % PRICE_FIELD, '-date_created')
+    return queryset.order_by('price_known', PRICE_FIELD, '-date_created')
+
+
+def normalize_search_params(request_data):
+    """
+    Return the search parameters that decide the results, normalized so
+    the same search spelled differently compares equal.
+    """
+    return OrderedDict([
+        ('q', ' '.join(request_data.get('q', '').lower().split())),
+        ('grade', sorted(set(request_data.getlist('grade', [])))),
+        ('carrier', sorted(set(request_data.getlist('carrier', [])))),
+        ('min_price', request_data.get('min_price') or None),
+        ('max_price', request_data.get('max_price') or None),
+        ('sort_by', request_data.get('sort_by') or None),
+    ])
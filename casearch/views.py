@@ -1,11 +1,28 @@
+import hashlib
+import os
 from django.shortcuts import render
 from django.views import View
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.encoding import force_bytes
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from oscar.core.loading import get_class, get_model
+from casearch.export import iter_ndjson
+from casearch.facets import get_search_facet_counts
+from casearch.feeds import FEEDS, MANIFEST_FILENAME
+from casearch.fulltext import filter_by_query
+from casearch.instrumentation import SearchProfile
+from casearch.resultcache import get_catalogue_version, get_result_cache_key, result_cache
+from casearch.utils import filter_by_attributes, filter_by_price, order_by_price
 
 Product = get_model('catalogue', 'product')
-Selector = get_class('partner.strategy', 'Selector')
 SearchForm = get_class('search.forms', 'SearchForm')
 
 
@@ -16,6 +33,7 @@ class IndexView(View):
     http_method_names = ['get']
 
     def get(self, request, *args, **kwargs):
+        profile = SearchProfile('casearch.index', request.GET, getattr(request, 'strategy', None))
         form = SearchForm(request.GET)
         page = int(request.GET.get('page', 1))
         per_page = int(request.GET.get('per_page', settings.OSCAR_PRODUCTS_PER_PAGE))
@@ -28,71 +46,204 @@ class IndexView(View):
         # get only non-canonical products.
         products = Product.browsable.all()
         ordered = False
-        product_list = []
         if request.GET.get('q') or len(request.GET.getlist('grade', [])) > 0 or \
                 len(request.GET.getlist('carrier', [])) > 0 or \
                 request.GET.get('min_price') or request.GET.get('max_price') or \
                 request.GET.get('sort_by'):
 
             if request.GET.get('q'):
-                products = products.filter(title__icontains=request.GET.get('q'))
+                # full-text match, ranked by relevance.
+                products = filter_by_query(products, request.GET.get('q'))
 
-            if len(request.GET.getlist('grade', [])) > 0:
-                products = products.filter(attribute_values__value_text__in=request.GET.getlist('grade', []))
+            products = filter_by_attributes(products, {
+                'grade': request.GET.getlist('grade', []),
+                'carrier': request.GET.getlist('carrier', []),
+            })
 
-            if len(request.GET.getlist('carrier', [])) > 0:
-                products = products.filter(attribute_values__value_text__in=request.GET.getlist('carrier', []))
+            # filter on price range.
+            products = filter_by_price(
+                products, request.GET.get('min_price'), request.GET.get('max_price'))
 
             if request.GET.get('sort_by'):
                 # explicitly sepcified an order.
-                if 'price' not in request.GET.get('sort_by'):
-                    # we sort by pricing differently.
+                if 'price' in request.GET.get('sort_by'):
+                    # sort by the denormalized effective price.
+                    products = order_by_price(products, request.GET.get('sort_by'))
+                else:
                     products = products.order_by(request.GET.get('sort_by'))
+            elif request.GET.get('q'):
+                products = products.order_by('-rank', '-date_updated')
             else:
                 products = products.order_by('-date_updated')
 
-            product_list = list(products)
-            # filter on price range.
-            strategy = Selector().strategy(request)
-            for product in products:
-                purchase_info = strategy.fetch_for_product(product)
-                # set price for sorting later.
-                product.price = float(purchase_info.price.excl_tax) if purchase_info.price.excl_tax else None
-                if request.GET.get('min_price') or request.GET.get('max_price'):
-                    # if searched by price range and product price is unknown,
-                    # we exclude the product from result.
-                    if not product.price:
-                        product_list.remove(product)
-                if request.GET.get('min_price'):
-                    if product.price and product.price < float(request.GET.get('min_price')):
-                        product_list.remove(product)
-                if request.GET.get('max_price'):
-                    if product.price and product.price > float(request.GET.get('max_price')):
-                        product_list.remove(product)
-            # sort by pricing.
-            if '-price' in request.GET.get('sort_by', ''):
-                # sort by descending order.
-                product_list = sorted(product_list, key=lambda p: p.price, reverse=True)
-            elif 'price' in request.GET.get('sort_by', ''):
-                # sort by ascending order.
-                product_list = sorted(product_list, key=lambda p: p.price)
-        else:
-            product_list = list(products)
+        # the ordered ids of popular searches are cached, pages are slices
+        # of them until the catalogue changes.
+        with profile.stage('query'):
+            cache_key = get_result_cache_key(request.GET)
+            version = get_catalogue_version()
+            product_ids = result_cache.get(cache_key, version)
+            if product_ids is None:
+                product_ids = list(products.values_list('pk', flat=True))
+                result_cache.set(cache_key, version, product_ids)
 
-        paginator = Paginator(product_list, per_page)
-        try:
-            product_list = paginator.page(page)
-        except PageNotAnInteger:
-            # If page is not an integer, deliver first page.
-            product_list = paginator.page(1)
-        except EmptyPage:
-            # If page is out of range (e.g. 9999), deliver last page of results.
-            product_list = paginator.page(paginator.num_pages)
+        with profile.stage('paginate'):
+            paginator = Paginator(product_ids, per_page)
+            try:
+                product_list = paginator.page(page)
+            except PageNotAnInteger:
+                # If page is not an integer, deliver first page.
+                product_list = paginator.page(1)
+            except EmptyPage:
+                # If page is out of range (e.g. 9999), deliver last page of results.
+                product_list = paginator.page(paginator.num_pages)
+            # stock records are left to the strategy below, which may have
+            # them cached.
+            page_products = Product.browsable.select_related('product_class').prefetch_related(
+                'children', 'product_options', 'product_class__options', 'images'
+            ).in_bulk(product_list.object_list)
+            product_list.object_list = [
+                page_products[pk] for pk in product_list.object_list if pk in page_products]
+            # priced together rather than by each product partial.
+            request.strategy.fetch_for_products(product_list.object_list)
+
+        with profile.stage('facets'):
+            # grade/carrier counts for the whole result set, not just this page.
+            facet_counts = get_search_facet_counts(request.GET, lambda: product_ids)
+            form.set_facet_counts(facet_counts)
 
         context = {
             'query': request.GET.get('q', ''),
             'search_form': form,
+            'facet_counts': facet_counts,
             'paginator': paginator,
             'page': product_list
         }
-        return render(request, self.template_name, context)
+        # prices and availability come from the batch above.
+        with profile.stage('render'):
+            response = render(request, self.template_name, context)
+        profile.finish()
+        return response
+
+
+class SuggestView(View):
+    """
+    Typeahead for the search box, returning a page of the product titles
+    and UPCs containing the typed text as JSON.
+
+    Lookups use the trigram indexes on title and UPC. Responses are cached
+    per normalized prefix, both here and by clients/proxies.
+    """
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs):
+        query = ' '.join(request.GET.get('q', '').split())
+        limit = getattr(settings, 'CASEARCH_SUGGEST_LIMIT', 10)
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+
+        if len(query) < getattr(settings, 'CASEARCH_SUGGEST_MIN_LENGTH', 3):
+            # too short for the trigram indexes to narrow anything down.
+            data = {'query': query, 'page': page, 'has_next': False, 'results': []}
+        else:
+            cache_key = 'casearch.suggest.%s.%s.%s' % (
+                hashlib.md5(force_bytes(query.lower())).hexdigest(), page, limit)
+            data = cache.get(cache_key)
+            if data is None:
+                data = self.get_suggestions(query, page, limit)
+                cache.set(cache_key, data, getattr(settings, 'CASEARCH_SUGGEST_CACHE_TIMEOUT', 60))
+
+        response = JsonResponse(data)
+        patch_cache_control(
+            response, public=True,
+            max_age=getattr(settings, 'CASEARCH_SUGGEST_CACHE_TIMEOUT', 60))
+        return response
+
+    def get_suggestions(self, query, page, limit):
+        offset = (page - 1) * limit
+        products = Product.browsable.filter(
+            Q(title__icontains=query) | Q(upc__icontains=query)
+        ).annotate(
+            # titles starting with the text first.
+            prefix_match=Case(
+                When(title__istartswith=query, then=Value(0)),
+                default=Value(1), output_field=IntegerField())
+        ).order_by('prefix_match', 'title', 'pk').values('pk', 'slug', 'title', 'upc')
+        # one extra row tells us if there is a next page, without a count.
+        rows = list(products[offset:offset + limit + 1])
+        return {
+            'query': query,
+            'page': page,
+            'has_next': len(rows) > limit,
+            'results': [{
+                'title': row['title'],
+                'upc': row['upc'],
+                'url': reverse('catalogue:detail', kwargs={
+                    'product_slug': row['slug'], 'pk': row['pk']}),
+            } for row in rows[:limit]],
+        }
+
+
+class ExportView(LoginRequiredMixin, View):
+    """
+    Read-only export of the catalogue as newline delimited json, one
+    product per line with its price, availability, grade and carrier, for
+    wholesale buyers to sync from instead of scraping the search pages.
+    Only signed in customers get it, anonymous requests are refused.
+
+    Pass updated_since (an ISO 8601 date or datetime) to only get the
+    products changed since. The response is streamed from a server side
+    cursor, so it costs the same memory for any catalogue size.
+    """
+    http_method_names = ['get']
+    # a 403 for the sync scripts rather than the login page.
+    raise_exception = True
+
+    def get(self, request, *args, **kwargs):
+        updated_since = None
+        if request.GET.get('updated_since'):
+            updated_since = self.parse_updated_since(request.GET['updated_since'])
+            if updated_since is None:
+                return JsonResponse(
+                    {'error': 'updated_since must be an ISO 8601 date or datetime.'}, status=400)
+        response = StreamingHttpResponse(
+            iter_ndjson(updated_since), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'inline; filename="catalogue.ndjson"'
+        return response
+
+    def parse_updated_since(self, value):
+        try:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                date = parse_date(value)
+                if date is None:
+                    return None
+                parsed = timezone.datetime(date.year, date.month, date.day)
+        except ValueError:
+            return None
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+
+class FeedView(View):
+    """
+    Serve the files of a product feed as casearch_generate_feeds wrote
+    them: the gzip compressed shards, the manifest and the sitemap index.
+    """
+    http_method_names = ['get', 'head']
+
+    def get(self, request, feed, filename, *args, **kwargs):
+        # the files only, building the feed would look up the site.
+        feed = FEEDS[feed]
+        path = os.path.join(feed.get_root(), filename)
+        if not os.path.isfile(path):
+            raise Http404
+        if filename.endswith('.gz'):
+            content_type = 'application/x-gzip'
+        elif filename == MANIFEST_FILENAME:
+            content_type = 'application/json'
+        else:
+            content_type = feed.content_type
+        return FileResponse(open(path, 'rb'), content_type=content_type)
@@ -146,6 +146,15 @@ DATABASES = {
 }
 
 
+# Cache shared by all worker processes.
+# create the table with: python manage.py createcachetable
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cell_again_cache',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.10/ref/settings/#auth-password-validators
@@ -210,9 +219,16 @@ HAYSTACK_CONNECTIONS = {
         # 'ENGINE': 'haystack.backends.solr_backend.SolrEngine',
         # 'URL': 'http://127.0.0.1:8983/solr',
         # 'INCLUDE_SPELLING': True,
-        'ENGINE': 'haystack.backends.simple_backend.SimpleEngine',
+        # in-process inverted index, shared by the workers through mmap.
+        'ENGINE': 'casearch.search_backend.InvertedIndexEngine',
+        'PATH': os.path.join(BASE_DIR, 'search_index', 'products'),
+        # delta log entries kept before they are merged into the segment.
+        'MERGE_THRESHOLD': 1000,
     },
 }
+# queue product, stock record and attribute changes for the search index,
+# applied by casearch_process_index_queue.
+HAYSTACK_SIGNAL_PROCESSOR = 'casearch.indexing.QueuedSignalProcessor'
 # oscar configurations.
 OSCAR_SHOP_NAME = 'CellAgain'
 OSCAR_DEFAULT_CURRENCY = 'USD'
@@ -298,6 +314,54 @@ OSCAR_SEARCH_FACETS = {
 OSCAR_MIN_BASKET_QUANTITY_THRESHOLD_WHOLESALE = 5
 OSCAR_FIXED_PRICE_SHIPPING_CHG_EXCL_TAX = '15.00'
 OSCAR_FIXED_PRICE_SHIPPING_CHG_INCL_TAX = '30.00'
+# cache alias holding the price, currency and stock of each product, so
+# listings and product pages skip reading stock records; None to read them
+# every time. Off here since the only cache is the database one, which
+# reads each product's entry with its own query: use a memcached alias.
+# Entries are invalidated as soon as a stock record changes.
+PARTNER_STOCK_CACHE = None
+PARTNER_STOCK_CACHE_TIMEOUT = 60 * 10
+# seconds the search form's grade/carrier choices stay cached,
+# they are invalidated as soon as an attribute value changes anyway.
+SEARCH_FACET_CHOICES_CACHE_TIMEOUT = 60 * 60
+# grade/carrier product id bitmaps behind the search facet counts, dropped
+# as soon as an attribute value changes and rebuilt by the next search.
+CASEARCH_FACET_BITMAPS_CACHE_TIMEOUT = 60 * 60 * 24
+# grade/carrier/price counts of each search, any catalogue change
+# invalidates them.
+CASEARCH_FACET_COUNTS_CACHE_TIMEOUT = 60 * 60
+# price ranges offered by search, split on quantiles of the actual prices
+# and recomputed when they expire or by casearch_update_price_buckets; the
+# products in each are rebuilt as soon as a price changes.
+CASEARCH_PRICE_BUCKETS = 8
+CASEARCH_PRICE_BUCKETS_CACHE_TIMEOUT = 60 * 60 * 6
+# searches whose ordered result ids each process keeps, least recently used
+# dropped first. Any catalogue change invalidates them.
+CASEARCH_RESULT_CACHE_SIZE = 256
+# catalogue listings the database expects to have at least this many results
+# show an estimated number of pages instead of counting them, None to
+# always count.
+CASEARCH_APPROXIMATE_COUNT_ABOVE = 10000
+# milliseconds after which a search request goes to the slow search log,
+# None to never log.
+CASEARCH_SLOW_SEARCH_THRESHOLD = 500
+# share of the searches, 0 to 1, whose queries the slow search log counts
+# when DEBUG is off. counting them logs every query of those searches.
+CASEARCH_QUERY_COUNT_SAMPLE_RATE = 0
+# search box typeahead: results per page, characters needed
+# before suggesting and seconds a response stays cached.
+CASEARCH_SUGGEST_LIMIT = 10
+CASEARCH_SUGGEST_MIN_LENGTH = 3
+CASEARCH_SUGGEST_CACHE_TIMEOUT = 60
+# products the catalogue export reads from its cursor at a time.
+CASEARCH_EXPORT_CHUNK_SIZE = 2000
+# product feeds and sitemaps: where they are written, product ids per shard
+# and products priced at a time. The base url defaults to the current site.
+CASEARCH_FEEDS_ROOT = os.path.join(BASE_DIR, 'feeds')
+CASEARCH_FEEDS_SHARD_SIZE = 10000
+CASEARCH_FEEDS_CHUNK_SIZE = 500
+CASEARCH_FEEDS_BASE_URL = None
+CASEARCH_FEEDS_CONDITION = 'used'
 # stripe configurations.
 STRIPE_SECRET_KEY = ''
 STRIPE_PUBLIC_KEY = ''
@@ -310,6 +374,10 @@ US_STATE_WISE_SALES_TAX = {
     'tx': '0.0625',  # 6.25%.
     'texas': '0.0625',  # 6.25%.
 }
+# csv of state, county and ZIP range sales tax rates, see
+# custom_oscar_apps/partner/salestax.py; the states above apply to the
+# states it does not name.
+US_SALES_TAX_RATES_FILE = None
 WIRE_TRANSFER_DETAILS = (
     'Bank: Chase<br />'
     'Account Number: 12345678<br />'
@@ -383,6 +451,12 @@ LOGGING = {
             'class': 'logging.FileHandler',
             'formatter': 'simple',
             'filename': '/var/log/stripe.log'
+        },
+        'casearch.slow_search': {
+            'level': 'WARNING',
+            'class': 'logging.FileHandler',
+            'formatter': 'simple',
+            'filename': '/var/log/slow_search.log'
         }
     },
     'loggers': {
@@ -415,6 +489,11 @@ LOGGING = {
             'handlers': ['oscar.catalogue.import'],
             'propagate': True,
             'level': 'DEBUG',
+        },
+        'casearch.slow_search': {
+            'handlers': ['casearch.slow_search'],
+            'propagate': False,
+            'level': 'WARNING',
         }
     }
 }
@@ -1,10 +1,15 @@
 from django.conf import settings
+from django.utils import six
 from django.views.generic.list import MultipleObjectMixin
 from oscar.core.loading import get_class, get_model
+from casearch.facets import get_search_facet_counts
+from casearch.fulltext import filter_by_query
+from casearch.instrumentation import SearchProfile
+from casearch.pagination import KeysetPaginator
+from casearch.utils import filter_by_attributes, filter_by_price, order_by_price
 
 Product = get_model('catalogue', 'Product')
 SearchForm = get_class('search.forms', 'SearchForm')
-Selector = get_class('partner.strategy', 'Selector')
 
 
 class SimpleProductSearchHandler(MultipleObjectMixin):
@@ -17,6 +22,7 @@ class SimpleProductSearchHandler(MultipleObjectMixin):
     mixin; the mixin just does most of what we need it to do.
     """
     paginate_by = settings.OSCAR_PRODUCTS_PER_PAGE
+    paginator_class = KeysetPaginator
     form_class = SearchForm
 
     def __init__(self, request, request_data, full_path, categories=None):
@@ -24,31 +30,44 @@ class SimpleProductSearchHandler(MultipleObjectMixin):
         self.categories = categories
         self.request_data = request_data
         self.kwargs = {'page': request_data.get('page', 1)}
-        self.object_list = self.get_queryset()
+        # the view finishes it once the response is rendered.
+        self.profile = SearchProfile('catalogue', request_data, getattr(request, 'strategy', None))
+        with self.profile.stage('filter'):
+            self.object_list = self.get_queryset()
         self.form = self.form_class(request_data)
 
+    def get_paginator(self, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True, **kwargs):
+        # only the requested page is fetched, seeking from the previous
+        # page's cursor when we have one. Broad listings go by the
+        # planner's estimate rather than a count.
+        kwargs.setdefault(
+            'approximate_count_above',
+            getattr(settings, 'CASEARCH_APPROXIMATE_COUNT_ABOVE', None))
+        return self.paginator_class(
+            queryset, per_page, orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page,
+            cursor=self.request_data.get('cursor'), **kwargs)
+
     def get_ordering(self):
         if self.request_data.get('sort_by'):
             # explicitly sepcified an order.
             if 'price' not in self.request_data.get('sort_by'):
                 # we sort by pricing differently.
-                self.request_data.get('sort_by')
+                return self.request_data.get('sort_by')
+        elif self.request_data.get('q'):
+            return ('-rank', '-date_updated')
         else:
-            '-date_updated'
+            return '-date_updated'
 
-    def get_ordered_by_price(self, product_list, sort_by):
-        if sort_by:
-            if '-price' in sort_by:
-                # sort by descending order.
-                product_list = sorted(product_list, key=lambda p: p.price, reverse=True)
-            elif 'price' in sort_by:
-                # sort by ascending order.
-                product_list = sorted(product_list, key=lambda p: p.price)
-        return product_list
+    def get_ordered_by_price(self, qs, sort_by):
+        if sort_by and 'price' in sort_by:
+            # sort by the denormalized effective price.
+            qs = order_by_price(qs, sort_by)
+        return qs
 
     def get_queryset(self):
         qs = Product.browsable.base_queryset()
-        product_list = []
         if self.categories:
             qs = qs.filter(categories__in=self.categories).distinct()
         # form filters.
@@ -56,13 +75,13 @@ class SimpleProductSearchHandler(MultipleObjectMixin):
                 len(self.request_data.getlist('carrier', [])) > 0:
 
             if self.request_data.get('q'):
-                qs = qs.filter(title__icontains=self.request_data.get('q'))
-
-            if len(self.request_data.getlist('grade', [])) > 0:
-                qs = qs.filter(attribute_values__value_text__in=self.request_data.getlist('grade'))
+                # full-text match, ranked by relevance.
+                qs = filter_by_query(qs, self.request_data.get('q'))
 
-            if len(self.request_data.getlist('carrier', [])) > 0:
-                qs = qs.filter(attribute_values__value_text__in=self.request_data.getlist('carrier'))
+            qs = filter_by_attributes(qs, {
+                'grade': self.request_data.getlist('grade', []),
+                'carrier': self.request_data.getlist('carrier', []),
+            })
         # ordering.
         ordering = self.get_ordering()
         if ordering:
@@ -70,34 +89,31 @@ class SimpleProductSearchHandler(MultipleObjectMixin):
                 ordering = (ordering,)
             qs = qs.order_by(*ordering)
 
-        product_list = list(qs)
         # filter on price range.
-        strategy = Selector().strategy(self.request)
-        for product in qs:
-            purchase_info = strategy.fetch_for_product(product)
-            product.price = float(purchase_info.price.excl_tax) if purchase_info.price.excl_tax else None
-            if self.request_data.get('min_price') or self.request_data.get('max_price'):
-                # if searched by price range and product price is unknown,
-                # we exclude the product from result.
-                if not product.price:
-                    product_list.remove(product)
-            if self.request_data.get('min_price'):
-                if product.price and product.price < float(self.request_data.get('min_price')):
-                    product_list.remove(product)
-            if self.request_data.get('max_price'):
-                if product.price and product.price > float(self.request_data.get('max_price')):
-                    product_list.remove(product)
-
+        qs = filter_by_price(
+            qs, self.request_data.get('min_price'), self.request_data.get('max_price'))
         # sort by price.
-        product_list = self.get_ordered_by_price(product_list, self.request_data.get('sort_by'))
+        qs = self.get_ordered_by_price(qs, self.request_data.get('sort_by'))
 
-        return product_list
+        return qs
 
     def get_search_context_data(self, context_object_name):
         # Set the context_object_name instance property as it's needed
         # internally by MultipleObjectMixin
         self.context_object_name = context_object_name
-        context = self.get_context_data(object_list=self.object_list)
-        context[context_object_name] = context['page_obj'].object_list
+        with self.profile.stage('paginate'):
+            context = self.get_context_data(object_list=self.object_list)
+            context[context_object_name] = context['page_obj'].object_list
+            # priced together rather than by each product partial.
+            self.request.strategy.fetch_for_products(context[context_object_name])
+        with self.profile.stage('facets'):
+            # the ids are only read when the counts of this search are
+            # not cached yet, and then once for the attribute and price
+            # counts.
+            context['facet_counts'] = get_search_facet_counts(
+                self.request_data,
+                lambda: list(self.object_list.order_by().values_list('pk', flat=True)),
+                scope=sorted(c.pk for c in self.categories or ()))
+            self.form.set_facet_counts(context['facet_counts'])
         context['form'] = self.form
         return context
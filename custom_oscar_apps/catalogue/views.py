@@ -5,6 +5,17 @@ from django.shortcuts import redirect
 from oscar.apps.catalogue import views
 
 
+def render_profiled(search_handler, response):
+    # the search handler times its stages, add rendering and log it.
+    profile = getattr(search_handler, 'profile', None)
+    if profile is None:
+        return response
+    with profile.stage('render'):
+        response.render()
+    profile.finish()
+    return response
+
+
 class CatalogueView(views.CatalogueView):
     def get(self, request, *args, **kwargs):
         try:
@@ -14,7 +25,9 @@ class CatalogueView(views.CatalogueView):
             # Redirect to page one.
             messages.error(request, _('The given page number was invalid.'))
             return redirect('catalogue:index')
-        return super(views.CatalogueView, self).get(request, *args, **kwargs)
+        return render_profiled(
+            self.search_handler,
+            super(views.CatalogueView, self).get(request, *args, **kwargs))
 
 
 class ProductCategoryView(views.ProductCategoryView):
@@ -33,4 +46,6 @@ class ProductCategoryView(views.ProductCategoryView):
             messages.error(request, _('The given page number was invalid.'))
             return redirect(self.category.get_absolute_url())
 
-        return super(views.ProductCategoryView, self).get(request, *args, **kwargs)
+        return render_profiled(
+            self.search_handler,
+            super(views.ProductCategoryView, self).get(request, *args, **kwargs))
@@ -0,0 +1,77 @@
+"""
+Splitting an order level amount, eg. sales tax or the payment fee,
+across lines in proportion to their value, in whole cents, so the parts
+add up to the amount.
+"""
+from decimal import Decimal as D, ROUND_FLOOR, ROUND_HALF_UP
+
+from custom_oscar_apps.checkout.money import from_cents, to_cents
+
+
+def allocate_lines(amount, weights, units=None):
+    """
+    Return the amount per unit of each line and the adjustment of each
+    line, as two lists of Decimals, the lines weighing weights (eg. their
+    prices) and holding units each (eg. their quantities, 1 by default).
+
+    Every line first gets the whole cents per unit of its exact share, and
+    the cents left go a cent per unit to the lines with the largest
+    remainders, in one pass over the lines sorted by remainder (largest
+    remainder method). Lines weighing nothing share the amount equally.
+
+    Cents per unit cannot always add up to the amount when lines hold
+    several units, eg. 7 cents over two lines of 10 units. The cents left
+    then go on a line holding a single unit, or else are returned as the
+    adjustment of the line with the largest remainder, for its line total
+    to carry, see the order app's OrderCreator.
+    """
+    if not weights:
+        return [], []
+    units = units or [1] * len(weights)
+    weights = [D(w) for w in weights]
+    total_weight = sum(weights)
+    if total_weight <= 0:
+        weights = [D(1)] * len(weights)
+        total_weight = D(len(weights))
+    cents = to_cents(amount)
+    per_unit = []
+    remainders = []
+    left = cents
+    for weight, count in zip(weights, units):
+        share = cents * weight / total_weight
+        unit_cents = int((share / count).to_integral_value(rounding=ROUND_FLOOR))
+        per_unit.append(unit_cents)
+        remainders.append(share - unit_cents * count)
+        left -= unit_cents * count
+    # a cent per unit more, to the lines the rounding shorted most.
+    by_remainder = sorted(range(len(per_unit)), key=lambda i: (-remainders[i], i))
+    for i in by_remainder:
+        if not left:
+            break
+        if units[i] <= left:
+            per_unit[i] += 1
+            left -= units[i]
+    adjustments = [0] * len(per_unit)
+    if left:
+        single = [i for i in by_remainder if units[i] == 1]
+        if single:
+            per_unit[single[0]] += left
+        else:
+            adjustments[by_remainder[0]] = left
+    return [from_cents(c) for c in per_unit], [from_cents(c) for c in adjustments]
+
+
+def allocate(amount, weights):
+    """
+    Return the share of each line holding a single unit, eg. a whole
+    order line, as a list of Decimals adding up to the amount.
+    """
+    return allocate_lines(amount, weights)[0]
+
+
+def unit_share(amount, units):
+    """
+    Return an amount per unit, eg. a line's tax over its quantity, rounded
+    to the nearest cent.
+    """
+    return from_cents(int((D(to_cents(amount)) / units).to_integral_value(rounding=ROUND_HALF_UP)))
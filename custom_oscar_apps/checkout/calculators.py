@@ -1,7 +1,7 @@
-from decimal import Decimal as D
-from oscar.core import prices
 from oscar.apps.checkout.calculators import *
 
+from custom_oscar_apps.checkout.money import Money, to_price
+
 
 class EschewBasketOrderTotalCalculator(object):
     """
@@ -22,27 +22,21 @@ class EschewBasketOrderTotalCalculator(object):
         # this allows caching of the lines.
         # hence any additional info like taxes added to
         # line prices are available here for total calculation.
-        query = order.all_lines()
-        updated_total_excl_tax = D('0.00')
-        updated_total_incl_tax = D('0.00')
+        lines = order.all_lines()
         if len(updated_lines) > 0:
-            # exclude the updated lines from query.
-            query = query.exclude(id__in=map(lambda ul: ul.id, updated_lines))
-            updated_total_excl_tax = sum([each_line.line_price_excl_tax for each_line in updated_lines])
-            updated_total_incl_tax = sum([each_line.line_price_incl_tax for each_line in updated_lines])
+            # the updated lines stand for their saved copies, the cached
+            # lines are filtered here rather than queried again.
+            updated_ids = set(ul.id for ul in updated_lines)
+            lines = [line for line in lines if line.id not in updated_ids] + list(updated_lines)
 
+        # summed in cents, plus shipping charge.
+        currency = order.basket.currency
         total_excl_tax = (
-            sum([line.line_price_excl_tax for line in query]) +
-            updated_total_excl_tax
+            Money.total([line.line_price_excl_tax for line in lines], currency) +
+            Money.from_amount(shipping_charge.excl_tax)
         )
         total_incl_tax = (
-            sum([line.line_price_incl_tax for line in query]) +
-            updated_total_incl_tax
+            Money.total([line.line_price_incl_tax for line in lines], currency) +
+            Money.from_amount(shipping_charge.incl_tax)
         )
-
-        # add shipping charge.
-        total_excl_tax += shipping_charge.excl_tax
-        total_incl_tax += shipping_charge.incl_tax
-        return prices.Price(
-            currency=order.basket.currency,
-            excl_tax=total_excl_tax, incl_tax=total_incl_tax)
+        return to_price(total_excl_tax, incl_tax=total_incl_tax)
@@ -0,0 +1,71 @@
+"""
+Money in integer cents for the checkout arithmetic: totals are summed and
+rates applied on ints, and amounts only become Decimals, or Oscar's
+prices.Price, at the edges.
+"""
+from collections import namedtuple
+from decimal import Decimal as D, ROUND_HALF_EVEN, ROUND_HALF_UP
+
+from oscar.core import prices
+
+CENT = D('0.01')
+
+
+def to_cents(amount):
+    # amounts with exactly two places, as read from the database, are the
+    # common case: reading their digits beats decimal arithmetic.
+    text = str(amount)
+    point = text.find('.')
+    if point != -1 and len(text) - point == 3 and 'E' not in text:
+        return int(text[:point] + text[point + 1:])
+    return int((D(amount) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return (D(cents) / 100).quantize(CENT)
+
+
+class Money(namedtuple('Money', ['cents', 'currency'])):
+    __slots__ = ()
+
+    @classmethod
+    def from_amount(cls, amount, currency=None):
+        return cls(to_cents(amount), currency)
+
+    @classmethod
+    def total(cls, amounts, currency=None):
+        """
+        Return the sum of Decimal amounts, eg. line prices, added as cents
+        in one pass.
+        """
+        return cls(sum(to_cents(a) for a in amounts if a is not None), currency)
+
+    @property
+    def amount(self):
+        return from_cents(self.cents)
+
+    def scale(self, rate):
+        """
+        Return the amount times a rate, eg. a tax or fee rate, rounded to
+        the cent like quantize does (half even).
+        """
+        return Money(int((self.cents * D(rate)).to_integral_value(rounding=ROUND_HALF_EVEN)), self.currency)
+
+    def __add__(self, other):
+        return Money(self.cents + other.cents, self.currency or other.currency)
+
+    def __sub__(self, other):
+        return Money(self.cents - other.cents, self.currency or other.currency)
+
+
+def to_price(excl_tax, incl_tax=None, tax=None):
+    """
+    Return a prices.Price of Money amounts, given its price incl. tax or
+    its tax.
+    """
+    kwargs = {}
+    if incl_tax is not None:
+        kwargs['incl_tax'] = incl_tax.amount
+    if tax is not None:
+        kwargs['tax'] = tax.amount
+    return prices.Price(currency=excl_tax.currency, excl_tax=excl_tax.amount, **kwargs)
@@ -0,0 +1,94 @@
+import random
+from decimal import Decimal as D
+
+from django.test import SimpleTestCase
+
+from custom_oscar_apps.checkout.allocation import allocate, allocate_lines, unit_share
+from custom_oscar_apps.checkout.money import Money, from_cents, to_cents, to_price
+
+
+def allocated_total(per_unit, units, adjustments=None):
+    return sum(u * n for u, n in zip(per_unit, units)) + sum(adjustments or [])
+
+
+class AllocateTest(SimpleTestCase):
+
+    def test_single_units_add_up(self):
+        self.assertEqual(allocate(D('10.00'), [1, 1, 1]), [D('3.34'), D('3.33'), D('3.33')])
+        self.assertEqual(allocate(D('0.05'), [D('9.99'), D('0.01')]), [D('0.05'), D('0.00')])
+
+    def test_largest_remainders_get_the_cents(self):
+        # 0.8239 and 0.3711 per unit floored leave 0.05: the 12 units of
+        # the first line need more, the 3 of the second get 0.03, the
+        # first line's total carries the 0.02 left.
+        per_unit, adjustments = allocate_lines(D('11.00'), [D('119.88'), D('13.50')], [12, 3])
+        self.assertEqual(per_unit, [D('0.82'), D('0.38')])
+        self.assertEqual(adjustments, [D('0.02'), D('0.00')])
+        self.assertEqual(allocated_total(per_unit, [12, 3], adjustments), D('11.00'))
+
+    def test_small_amount_over_many_units(self):
+        per_unit, adjustments = allocate_lines(D('0.07'), [10, 10], [10, 10])
+        self.assertEqual(per_unit, [D('0.00'), D('0.00')])
+        self.assertEqual(adjustments, [D('0.07'), D('0.00')])
+
+    def test_remainder_goes_on_single_unit_line(self):
+        per_unit, adjustments = allocate_lines(D('0.07'), [10, 10, 1], [10, 10, 1])
+        self.assertEqual(adjustments, [D('0.00')] * 3)
+        self.assertEqual(allocated_total(per_unit, [10, 10, 1]), D('0.07'))
+
+    def test_lines_add_up(self):
+        rng = random.Random(24)
+        for _ in range(500):
+            prices = [D(rng.randint(100, 50000)) / 100 for _ in range(rng.randint(1, 5))]
+            units = [rng.randint(5, 60) for _ in prices]
+            weights = [p * n for p, n in zip(prices, units)]
+            tax = (sum(weights) * D('0.0825')).quantize(D('0.01'))
+            per_unit, adjustments = allocate_lines(tax, weights, units)
+            self.assertEqual(allocated_total(per_unit, units, adjustments), tax)
+            self.assertTrue(all(D(0) <= a < D('0.01') * max(units) for a in adjustments))
+
+    def test_negative_amount(self):
+        per_unit = allocate(D('-1.00'), [1, 1, 1])
+        self.assertEqual(sum(per_unit), D('-1.00'))
+
+    def test_weightless_lines_share_equally(self):
+        self.assertEqual(allocate(D('1.00'), [0, 0]), [D('0.50'), D('0.50')])
+        self.assertEqual(allocate_lines(D('1.00'), []), ([], []))
+
+    def test_unit_share_rounds_to_nearest(self):
+        self.assertEqual(unit_share(D('9.89'), 12), D('0.82'))
+        self.assertEqual(unit_share(D('0.07'), 10), D('0.01'))
+        self.assertEqual(unit_share(D('0.04'), 10), D('0.00'))
+
+
+class MoneyTest(SimpleTestCase):
+
+    def test_cents(self):
+        self.assertEqual(to_cents(D('12.34')), 1234)
+        self.assertEqual(to_cents(D('-0.05')), -5)
+        self.assertEqual(to_cents(D('1.005')), 101)
+        self.assertEqual(to_cents(D('3')), 300)
+        self.assertEqual(to_cents(D('1E+1')), 1000)
+        self.assertEqual(from_cents(1234), D('12.34'))
+        self.assertEqual(from_cents(-5), D('-0.05'))
+
+    def test_total_skips_missing_amounts(self):
+        total = Money.total([D('1.10'), None, D('2.25')], 'USD')
+        self.assertEqual(total, Money(335, 'USD'))
+        self.assertEqual(total.amount, D('3.35'))
+
+    def test_scale_rounds_half_even(self):
+        self.assertEqual(Money(1000, 'USD').scale(D('0.0825')).cents, 82)
+        self.assertEqual(Money(50, 'USD').scale(D('0.05')).cents, 2)
+        self.assertEqual(Money(70, 'USD').scale(D('0.05')).cents, 4)
+
+    def test_arithmetic(self):
+        self.assertEqual(Money(100, 'USD') + Money(25, None), Money(125, 'USD'))
+        self.assertEqual(Money(100, None) - Money(25, 'USD'), Money(75, 'USD'))
+
+    def test_to_price(self):
+        price = to_price(Money(1000, 'USD'), tax=Money(83, 'USD'))
+        self.assertEqual(price.incl_tax, D('10.83'))
+        price = to_price(Money(1000, 'USD'), incl_tax=Money(1100, 'USD'))
+        self.assertEqual((price.currency, price.tax), ('USD', D('1.00')))
+        self.assertFalse(to_price(Money(1000, 'USD')).is_tax_known)
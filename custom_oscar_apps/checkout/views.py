@@ -18,6 +18,7 @@ from oscar.apps.checkout import views, mixins, session, \
     exceptions as checkout_exceptions, signals
 from oscar.apps.payment import exceptions, models as payment_models
 from oscar.core.loading import get_class, get_model
+from custom_oscar_apps.checkout.allocation import allocate, allocate_lines, unit_share
 from custom_oscar_apps.checkout.forms import StripePaymentForm, PaymentMethodForm
 from custom_oscar_apps.payment.methods import CARD_PAYMENT, WIRE_TRANSFER
 from custom_oscar_apps.payment.repository import Repository as PaymentRepository
@@ -147,18 +148,34 @@ class PlacePostPaidOrderView(mixins.OrderPlacementMixin, generic.TemplateView):
         """
         if submission['shipping_address'] and submission['shipping_method']:
             tax_info = self.get_sales_taxinfo()
-            line_count = len(submission['basket'].all_lines())
-            for line in submission['basket'].all_lines():
-                # get the tax per line.
-                tax_per_line = (tax_info.tax / line_count).quantize(D('0.01'))
-                # get tax per product in each line.
-                tax_per_product = (tax_per_line / line.quantity).quantize(D('0.01'))
+            lines = submission['basket'].all_lines()
+            # tax per product, shared by line value.
+            taxes, adjustments = allocate_lines(
+                tax_info.tax,
+                [line.line_price_excl_tax_incl_discounts or 0 for line in lines],
+                [line.quantity for line in lines])
+            for line, tax_per_product, adjustment in zip(lines, taxes, adjustments):
                 line.purchase_info.price.tax = tax_per_product
+                # cents the tax per product cannot carry, added to the
+                # order line's total by the OrderCreator.
+                line.tax_adjustment = adjustment
 
             # Recalculate order total to ensure we have a tax-inclusive total
-            submission['order_total'] = self.get_order_totals(
+            order_total = self.get_order_totals(
                 submission['basket'],
                 submission['shipping_charge'])
+            if any(adjustments) and order_total.is_tax_known:
+                order_total = prices.Price(
+                    currency=order_total.currency,
+                    excl_tax=order_total.excl_tax,
+                    incl_tax=order_total.incl_tax + sum(adjustments))
+            submission['order_total'] = order_total
+
+    def place_order(self, *args, **kwargs):
+        order = super(PlacePostPaidOrderView, self).place_order(*args, **kwargs)
+        # stock was allocated, purchase info memoized before is stale.
+        self.request.strategy.clear_purchase_info()
+        return order
 
     def build_submission(self, **kwargs):
         submission = super(PlacePostPaidOrderView, self).build_submission(
@@ -1213,12 +1230,12 @@ class PaymentDetailsView(views.PaymentDetailsView):
     def apply_tax_payment_fee(self, submission):
         tax_info = self.get_payment_method_taxinfo()
         if tax_info.is_tax_known:
-            line_count = len(self.order.all_lines())
-            for line in self.order.all_lines():
-                # get the tax per line.
-                tax_per_line = (tax_info.tax / line_count).quantize(D('0.01'))
+            lines = self.order.all_lines()
+            # the fee per line, shared by line value.
+            taxes = allocate(tax_info.tax, [line.line_price_excl_tax for line in lines])
+            for line, tax_per_line in zip(lines, taxes):
                 # get tax per product in each line.
-                tax_per_product = (tax_per_line / line.quantity).quantize(D('0.01'))
+                tax_per_product = unit_share(tax_per_line, line.quantity)
                 # we just need to update prices incl. tax.
                 line.line_price_incl_tax += tax_per_line
                 line.line_price_before_discounts_incl_tax += tax_per_line
@@ -10,6 +10,8 @@ from weasyprint import HTML, CSS
 from oscar.apps.dashboard.orders import views
 from oscar.core.loading import get_class, get_model
 
+from custom_oscar_apps.checkout.allocation import unit_share
+
 Order = get_model('order', 'Order')
 OrderTotalCalculator = get_class('checkout.calculators', 'EschewBasketOrderTotalCalculator')
 OrderEventHandler = get_class('order.processing', 'EventHandler')
@@ -42,8 +44,8 @@ class OrderDetailView(views.OrderDetailView):
         return order_line.line_price_incl_tax - order_line.line_price_excl_tax
 
     def _get_unit_tax(self, order_line):
-        line_tax = self._get_line_tax(order_line)
-        return (line_tax / order_line.quantity).quantize(D('0.01'))
+        # nearest whole cents per unit, as checkout splits taxes.
+        return unit_share(self._get_line_tax(order_line), order_line.quantity)
 
     def _restore_basket(self, basket):
         basket.status = basket.OPEN
@@ -223,7 +225,7 @@ class OrderDetailView(views.OrderDetailView):
                         # append affected lines for reporting.
                         updated_lines.append(line)
         # update stockrecord for stock tracking required products.
-        OrderEventHandler(request.user).cancel_stock_allocations(
+        OrderEventHandler(request.user, strategy=request.strategy).cancel_stock_allocations(
             order, lines_to_update_stockrecord, quantities_to_update_stockrecord
         )
         # submit basket.
@@ -6,6 +6,8 @@ from oscar.apps.order import processing
 from oscar.apps.order import exceptions as order_exceptions
 from oscar.core.loading import get_class, get_model
 
+from custom_oscar_apps.partner.stockcache import invalidate_cached_stockrecords
+
 logger = logging.getLogger('oscar.checkout')
 Dispatcher = get_class('customer.utils', 'Dispatcher')
 CommunicationEventType = get_model('customer', 'CommunicationEventType')
@@ -21,8 +23,11 @@ class EventHandler(processing.EventHandler):
     # Default code for the email to send after successful status change.
     communication_type_code = 'ORDER_APPROVED'
 
-    def __init__(self, user=None):
+    def __init__(self, user=None, strategy=None):
         super(EventHandler, self).__init__(user)
+        # the request's strategy, whose memoized purchase info goes stale
+        # when stock allocations change.
+        self.strategy = strategy
 
     def handle_order_status_change(self, order, new_status, note_msg=None):
         """
@@ -45,6 +50,20 @@ class EventHandler(processing.EventHandler):
         if note_msg:
             self.create_note(order, note_msg)
 
+    def consume_stock_allocations(self, order, lines, line_quantities):
+        super(EventHandler, self).consume_stock_allocations(order, lines, line_quantities)
+        self.stock_changed(lines)
+
+    def cancel_stock_allocations(self, order, lines, line_quantities):
+        super(EventHandler, self).cancel_stock_allocations(order, lines, line_quantities)
+        self.stock_changed(lines)
+
+    def stock_changed(self, lines):
+        # cached stock levels are stale now.
+        invalidate_cached_stockrecords([line.product_id for line in lines if line.product_id])
+        if self.strategy is not None:
+            self.strategy.clear_purchase_info()
+
     def send_order_approved_message(self, order, code, **kwargs):
         ctx = self.get_message_context(order)
         try:
@@ -0,0 +1,18 @@
+from oscar.apps.order.utils import *  # noqa
+from oscar.apps.order import utils
+
+
+class OrderCreator(utils.OrderCreator):
+
+    def create_line_models(self, order, basket_line, extra_line_fields=None):
+        # cents of the sales tax split the tax per product cannot carry,
+        # set on the basket line by PlacePostPaidOrderView, go on the line
+        # totals.
+        adjustment = getattr(basket_line, 'tax_adjustment', None)
+        if adjustment:
+            extra_line_fields = dict(
+                extra_line_fields or {},
+                line_price_incl_tax=basket_line.line_price_incl_tax_incl_discounts + adjustment,
+                line_price_before_discounts_incl_tax=basket_line.line_price_incl_tax + adjustment)
+        return super(OrderCreator, self).create_line_models(
+            order, basket_line, extra_line_fields)
@@ -3,3 +3,8 @@ from oscar.apps.partner import config
 
 class PartnerConfig(config.PartnerConfig):
     name = 'custom_oscar_apps.partner'
+
+    def ready(self):
+        # oscar's stock alert receivers.
+        super(PartnerConfig, self).ready()
+        from custom_oscar_apps.partner import receivers  # noqa
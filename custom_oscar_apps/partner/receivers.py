@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from oscar.core.loading import get_model
+
+from custom_oscar_apps.partner.stockcache import invalidate_cached_stockrecords
+
+StockRecord = get_model('partner', 'StockRecord')
+
+
+@receiver(post_save, sender=StockRecord)
+@receiver(post_delete, sender=StockRecord)
+def invalidate_cached_stockrecord_on_change(sender, instance, **kwargs):
+    invalidate_cached_stockrecords([instance.product_id])
@@ -0,0 +1,172 @@
+"""
+US sales tax rates by jurisdiction, looked up by shipping address.
+
+Rates are read from the CSV named by US_SALES_TAX_RATES_FILE, with the
+columns state, county, zip_from, zip_to and rate, eg.:
+
+    state,county,zip_from,zip_to,rate
+    tx,,,,0.0625
+    tx,Dallas,75201,75398,0.0825
+
+A row without ZIP codes is the rate of the whole state. A row with them
+is the combined rate of every ZIP code of the range, inclusive, and wins
+over the state's for addresses in that state. The state rates of
+US_STATE_WISE_SALES_TAX apply to the states the file does not name, or on
+their own without a file. States are given by code or by name, either way
+they are looked up by code.
+"""
+import csv
+import os
+import re
+from bisect import bisect_right
+from collections import namedtuple
+from decimal import Decimal as D, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+Jurisdiction = namedtuple('Jurisdiction', ['state', 'county', 'rate'])
+
+NO_TAX = Jurisdiction(state='', county='', rate=D('0.00'))
+# addresses remembered by a table before it starts over.
+MAX_LOOKUPS = 10000
+ZIP_RE = re.compile(r'^\s*(\d{5})')
+
+STATE_CODES = {
+    'alabama': 'al', 'alaska': 'ak', 'arizona': 'az', 'arkansas': 'ar',
+    'california': 'ca', 'colorado': 'co', 'connecticut': 'ct', 'delaware': 'de',
+    'district of columbia': 'dc', 'florida': 'fl', 'georgia': 'ga', 'hawaii': 'hi',
+    'idaho': 'id', 'illinois': 'il', 'indiana': 'in', 'iowa': 'ia', 'kansas': 'ks',
+    'kentucky': 'ky', 'louisiana': 'la', 'maine': 'me', 'maryland': 'md',
+    'massachusetts': 'ma', 'michigan': 'mi', 'minnesota': 'mn', 'mississippi': 'ms',
+    'missouri': 'mo', 'montana': 'mt', 'nebraska': 'ne', 'nevada': 'nv',
+    'new hampshire': 'nh', 'new jersey': 'nj', 'new mexico': 'nm', 'new york': 'ny',
+    'north carolina': 'nc', 'north dakota': 'nd', 'ohio': 'oh', 'oklahoma': 'ok',
+    'oregon': 'or', 'pennsylvania': 'pa', 'puerto rico': 'pr', 'rhode island': 'ri',
+    'south carolina': 'sc', 'south dakota': 'sd', 'tennessee': 'tn', 'texas': 'tx',
+    'utah': 'ut', 'vermont': 'vt', 'virginia': 'va', 'washington': 'wa',
+    'west virginia': 'wv', 'wisconsin': 'wi', 'wyoming': 'wy',
+}
+
+
+def normalize_state(state):
+    """
+    Return the lowercase code of a state given by code or name, eg. 'tx'
+    for 'Texas', or the cleaned up text when not a known name.
+    """
+    state = ' '.join((state or '').lower().replace('.', '').split())
+    return STATE_CODES.get(state, state)
+
+
+def parse_zip(postcode):
+    """
+    Return the 5 digit ZIP code of a postcode as an int, eg. 75201 for
+    '75201-1234', or None.
+    """
+    match = ZIP_RE.match(postcode or '')
+    return int(match.group(1)) if match else None
+
+
+class SalesTaxTable(object):
+    """
+    The ZIP ranges of each state sorted by their first ZIP code, searched
+    with bisect, and the state rates in a dict. Lookups are memoized per
+    address.
+    """
+
+    def __init__(self, states, ranges):
+        # ranges are (zip_from, zip_to, jurisdiction) tuples.
+        by_state = {}
+        for zip_range in ranges:
+            by_state.setdefault(zip_range[2].state, []).append(zip_range)
+        # state to the (starts, ends, jurisdictions) of its ranges.
+        self.ranges = {}
+        for state, state_ranges in by_state.items():
+            state_ranges.sort(key=lambda r: r[0])
+            for previous, current in zip(state_ranges, state_ranges[1:]):
+                if current[0] <= previous[1]:
+                    raise ImproperlyConfigured(
+                        'Sales tax ZIP ranges %s-%s and %s-%s overlap.' % (
+                            previous[0], previous[1], current[0], current[1]))
+            self.ranges[state] = (
+                [r[0] for r in state_ranges],
+                [r[1] for r in state_ranges],
+                [r[2] for r in state_ranges])
+        self.states = states
+        self._lookups = {}
+
+    @classmethod
+    def from_settings(cls):
+        states = dict(
+            (normalize_state(state), Jurisdiction(normalize_state(state), '', D(rate)))
+            for state, rate in getattr(settings, 'US_STATE_WISE_SALES_TAX', {}).items())
+        ranges = []
+        path = getattr(settings, 'US_SALES_TAX_RATES_FILE', None)
+        if path:
+            with open(path) as f:
+                for line, row in enumerate(csv.DictReader(f), 2):
+                    try:
+                        jurisdiction = Jurisdiction(
+                            normalize_state(row['state']), (row['county'] or '').strip(),
+                            D(row['rate'].strip()))
+                        zip_from, zip_to = row['zip_from'].strip(), row['zip_to'].strip()
+                        if zip_from or zip_to:
+                            ranges.append((int(zip_from), int(zip_to or zip_from), jurisdiction))
+                        else:
+                            states[jurisdiction.state] = jurisdiction
+                    except (KeyError, AttributeError, ValueError, InvalidOperation):
+                        raise ImproperlyConfigured(
+                            'Invalid sales tax rate on line %s of %s.' % (line, path))
+        return cls(states, ranges)
+
+    def lookup(self, state, postcode):
+        """
+        Return the jurisdiction taxing an address, NO_TAX when none does.
+        """
+        key = (normalize_state(state), parse_zip(postcode))
+        try:
+            return self._lookups[key]
+        except KeyError:
+            pass
+        state, zip_code = key
+        jurisdiction = None
+        # a ZIP code only counts within the address's state, a mistyped
+        # one must not bring in another state's county rate.
+        if zip_code is not None and state in self.ranges:
+            starts, ends, jurisdictions = self.ranges[state]
+            i = bisect_right(starts, zip_code) - 1
+            if i >= 0 and zip_code <= ends[i]:
+                jurisdiction = jurisdictions[i]
+        if jurisdiction is None:
+            jurisdiction = self.states.get(state, NO_TAX)
+        if len(self._lookups) >= MAX_LOOKUPS:
+            self._lookups.clear()
+        self._lookups[key] = jurisdiction
+        return jurisdiction
+
+
+_table = None
+_table_mtime = None
+
+
+def get_sales_tax_table():
+    """
+    Return the table for the current settings, loaded once per process and
+    again when the rates file changes.
+    """
+    global _table, _table_mtime
+    path = getattr(settings, 'US_SALES_TAX_RATES_FILE', None)
+    mtime = os.path.getmtime(path) if path else None
+    if _table is None or mtime != _table_mtime:
+        _table = SalesTaxTable.from_settings()
+        _table_mtime = mtime
+    return _table
+
+
+@receiver(setting_changed)
+def reset_sales_tax_table(setting, **kwargs):
+    global _table
+    if setting in ('US_SALES_TAX_RATES_FILE', 'US_STATE_WISE_SALES_TAX'):
+        _table = None
@@ -0,0 +1,87 @@
+"""
+Shared cache of the stock record the strategy picks for each product, so
+product pages and listings can price products without reading stock
+records.
+
+Only what pricing and availability read is kept: the stock record's id,
+partner, currency, price excl. tax and its stock in and allocated, which
+make up its net stock level.
+
+It is enabled by pointing PARTNER_STOCK_CACHE at a cache alias, one that
+reads many keys in one round trip such as memcached: the database cache
+reads them a query each.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from oscar.core.loading import get_model
+
+STOCK_CACHE_KEY = 'partner.stockrecord.%s'
+CACHED_FIELDS = (
+    'id', 'partner_id', 'price_currency', 'price_excl_tax', 'num_in_stock', 'num_allocated')
+
+
+def _get_cache():
+    alias = getattr(settings, 'PARTNER_STOCK_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _get_key(product_id):
+    return STOCK_CACHE_KEY % product_id
+
+
+def _get_fields():
+    # in the order of the model's fields, as from_db takes them.
+    return [
+        f.attname for f in get_model('partner', 'StockRecord')._meta.concrete_fields
+        if f.attname == 'product_id' or f.attname in CACHED_FIELDS]
+
+
+def get_cached_stockrecords(product_ids):
+    """
+    Return a dict of product id to the stock record the strategy picks
+    for it, None for products known to have none, for the products found
+    in the cache.
+
+    The stock records hold the cached fields only, the others are
+    deferred and read from the database if ever asked for.
+    """
+    cache = _get_cache()
+    if cache is None:
+        return {}
+    StockRecord = get_model('partner', 'StockRecord')
+    fields = _get_fields()
+    keys = dict((_get_key(pk), pk) for pk in product_ids)
+    stockrecords = {}
+    for key, values in cache.get_many(list(keys)).items():
+        if not values:
+            stockrecords[keys[key]] = None
+        else:
+            values = dict(zip(CACHED_FIELDS, values), product_id=keys[key])
+            stockrecords[keys[key]] = StockRecord.from_db(
+                connection.alias, fields, [values[f] for f in fields])
+    return stockrecords
+
+
+def set_cached_stockrecords(stockrecords):
+    """
+    Cache the stock record (or None) of each product id of the dict, as a
+    tuple of its CACHED_FIELDS.
+    """
+    cache = _get_cache()
+    if cache is None or not stockrecords:
+        return
+    cache.set_many(
+        dict((_get_key(pk), tuple(getattr(s, f) for f in CACHED_FIELDS) if s is not None else ())
+             for pk, s in stockrecords.items()),
+        getattr(settings, 'PARTNER_STOCK_CACHE_TIMEOUT', 60 * 10))
+
+
+def invalidate_cached_stockrecords(product_ids):
+    cache = _get_cache()
+    if cache is None or not product_ids:
+        return
+    keys = [_get_key(pk) for pk in product_ids]
+    cache.delete_many(keys)
+    # again once committed, in case a request cached the old row meanwhile.
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -1,8 +1,15 @@
+import copy
 from decimal import Decimal as D
-from django.conf import settings
+from django.db.models import Q
+from django.utils.functional import cached_property
 from oscar.core import prices
+from oscar.core.loading import get_model
 from oscar.apps.partner import strategy
 
+from custom_oscar_apps.checkout.money import Money
+from custom_oscar_apps.partner.salestax import NO_TAX, get_sales_tax_table
+from custom_oscar_apps.partner.stockcache import get_cached_stockrecords, set_cached_stockrecords
+
 
 class Selector(object):
     """
@@ -43,6 +50,163 @@ class CellAgain(strategy.UseFirstStockRecord, strategy.StockRequired, strategy.D
       after the shipping address/payment details is entered).
     """
 
+    def __init__(self, request=None):
+        super(CellAgain, self).__init__(request)
+        # (product id, stock record id or None) to PurchaseInfo, so a
+        # product is priced once per request. Strategies without a request
+        # may live as long as the process, eg. the search index's, and
+        # must not keep prices around.
+        self.memoize = request is not None
+        self._purchase_info = {}
+        self.purchase_info_hits = 0
+        self.purchase_info_misses = 0
+
+    def _memo_key(self, product, stockrecord=None):
+        return (product.pk, stockrecord.pk if stockrecord is not None else None)
+
+    def _memoized(self, key, fetch, *args):
+        if not self.memoize:
+            return fetch(*args)
+        try:
+            info = self._purchase_info[key]
+        except KeyError:
+            self.purchase_info_misses += 1
+            info = self._purchase_info[key] = fetch(*args)
+        else:
+            self.purchase_info_hits += 1
+        return self._hand_out(info)
+
+    def _hand_out(self, info):
+        # checkout sets the tax on a line's price, every caller gets a
+        # price of its own so the memoized one stays untaxed.
+        return info._replace(price=copy.copy(info.price))
+
+    def clear_purchase_info(self):
+        """
+        Forget the memoized purchase info once stock was allocated, see
+        PlacePostPaidOrderView.place_order and the order EventHandler.
+        """
+        self._purchase_info.clear()
+
+    def get_purchase_info_stats(self):
+        return {'hits': self.purchase_info_hits, 'misses': self.purchase_info_misses}
+
+    def fetch_for_product(self, product, stockrecord=None):
+        return self._memoized(
+            self._memo_key(product, stockrecord),
+            super(CellAgain, self).fetch_for_product, product, stockrecord)
+
+    def fetch_for_parent(self, product):
+        return self._memoized(
+            self._memo_key(product), super(CellAgain, self).fetch_for_parent, product)
+
+    def select_stockrecord(self, product):
+        # the shared stock cache first, unless the stock records are at
+        # hand already, eg. prefetched for the search index.
+        if 'stockrecords' in getattr(product, '_prefetched_objects_cache', {}):
+            return super(CellAgain, self).select_stockrecord(product)
+        try:
+            return get_cached_stockrecords([product.pk])[product.pk]
+        except KeyError:
+            stockrecord = super(CellAgain, self).select_stockrecord(product)
+            set_cached_stockrecords({product.pk: stockrecord})
+            return stockrecord
+
+    def fetch_for_line(self, line, stockrecord=None):
+        if self.memoize and line.basket_id is not None and \
+                self._memo_key(line.product) not in self._purchase_info:
+            # price the whole basket at once, the other lines follow.
+            self.fetch_for_products(
+                [l.product for l in line.basket.all_lines() if l.product_id is not None])
+        return self.fetch_for_product(line.product)
+
+    def fetch_for_products(self, products):
+        """
+        Return a dict of product to PurchaseInfo for many products at once,
+        loading the stock records of all of them, and of the children of
+        the parents among them, in one query.
+
+        Stock records of standalone products are read from the shared
+        stock cache first, so usually only parents need the query.
+
+        The results are memoized with the rest, so fetch_for_product and
+        fetch_for_parent answer for these products without a query
+        afterwards, eg. from the product partials of a listing page.
+        """
+        products = list(products)
+        infos = {}
+        pending = []
+        for product in products:
+            key = self._memo_key(product)
+            if self.memoize and key in self._purchase_info:
+                self.purchase_info_hits += 1
+                infos[product.pk] = self._purchase_info[key]
+            else:
+                pending.append(product)
+        if pending:
+            self._load_product_classes(pending)
+            parents = dict((p.pk, p) for p in pending if p.is_parent)
+            stockrecords = get_cached_stockrecords([p.pk for p in pending if not p.is_parent])
+            missing = [p.pk for p in pending if not p.is_parent and p.pk not in stockrecords]
+            children_stock = dict((pk, []) for pk in parents)
+            if missing or parents:
+                loaded = {}
+                # children in the order product.children lists them, each
+                # with its first stock record.
+                records = get_model('partner', 'StockRecord').objects.filter(
+                    Q(product_id__in=missing) | Q(product__parent_id__in=list(parents))
+                ).select_related('product').order_by('-product__date_created', 'product_id', 'pk')
+                for stockrecord in records:
+                    child = stockrecord.product
+                    if child.pk in loaded:
+                        continue
+                    loaded[child.pk] = stockrecord
+                    if child.parent_id in parents:
+                        # saves a query for its product class.
+                        child.parent = parents[child.parent_id]
+                        children_stock[child.parent_id].append((child, stockrecord))
+                set_cached_stockrecords(dict((pk, loaded.get(pk)) for pk in missing))
+                stockrecords.update(loaded)
+            for product in pending:
+                if product.is_parent:
+                    stock = children_stock[product.pk]
+                    info = strategy.PurchaseInfo(
+                        price=self.parent_pricing_policy(product, stock),
+                        availability=self.parent_availability_policy(product, stock),
+                        stockrecord=None)
+                else:
+                    stockrecord = stockrecords.get(product.pk)
+                    info = strategy.PurchaseInfo(
+                        price=self.pricing_policy(product, stockrecord),
+                        availability=self.availability_policy(product, stockrecord),
+                        stockrecord=stockrecord)
+                infos[product.pk] = info
+                if self.memoize:
+                    self.purchase_info_misses += 1
+                    self._purchase_info[self._memo_key(product)] = info
+        if self.memoize:
+            return dict((p, self._hand_out(infos[p.pk])) for p in products)
+        return dict((p, infos[p.pk]) for p in products)
+
+    def _load_product_classes(self, products):
+        # availability reads the product class of every product, children
+        # have their parent's.
+        Product = type(products[0])
+        parents = [
+            p for p in products if p.parent_id is not None and not Product.parent.is_cached(p)]
+        if parents:
+            loaded = Product.objects.select_related('product_class').in_bulk(
+                set(p.parent_id for p in parents))
+            for product in parents:
+                product.parent = loaded[product.parent_id]
+        missing = [
+            p for p in products
+            if p.product_class_id is not None and not Product.product_class.is_cached(p)]
+        if missing:
+            classes = get_model('catalogue', 'ProductClass').objects.in_bulk(set(p.product_class_id for p in missing))
+            for product in missing:
+                product.product_class = classes[product.product_class_id]
+
 
 class BaseSalesTax(object):
     code = ''
@@ -66,29 +230,44 @@ class USStateWiseSalesTax(BaseSalesTax):
         self.excl_tax = excl_tax
         self.shipping_address = shipping_address
 
+    @cached_property
+    def jurisdiction(self):
+        if self.shipping_address:
+            return get_sales_tax_table().lookup(
+                self.shipping_address.state, self.shipping_address.postcode)
+        return NO_TAX
+
+    @cached_property
+    def rate_percent(self):
+        return (self.rate * 100).quantize(D('0.01'))
+
     @property
     def name(self):
+        if self.jurisdiction.county:
+            return '%s county, %s sales tax (%s%%)' % (
+                self.jurisdiction.county,
+                self.shipping_address.state,
+                self.rate_percent
+            )
         return '%s state sales tax (%s%%)' % (
             self.shipping_address.state,
-            (self.rate * 100).quantize(D('0.01'))
+            self.rate_percent
         )
 
     @property
     def description(self):
         return 'Sales tax of %s is applicable for the state of %s.' % (
-            (self.rate * 100).quantize(D('0.01')),
+            self.rate_percent,
             self.shipping_address.state
         )
 
     @property
     def rate(self):
-        if self.shipping_address:
-            return D(settings.US_STATE_WISE_SALES_TAX.get(self.shipping_address.state.lower(), '0.00'))
-        return D('0.00')
+        return self.jurisdiction.rate
 
     def calculate(self):
         return prices.Price(
             currency=self.currency,
             excl_tax=self.excl_tax,
-            tax=(self.excl_tax * self.rate).quantize(D('0.01'))
+            tax=Money.from_amount(self.excl_tax).scale(self.rate).amount
         )
@@ -0,0 +1,104 @@
+from decimal import Decimal as D
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ImproperlyConfigured
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from oscar.apps.partner.availability import Available
+from oscar.apps.partner.prices import FixedPrice
+from oscar.apps.partner.strategy import PurchaseInfo
+from oscar.core.loading import get_model
+
+from custom_oscar_apps.partner.salestax import (
+    NO_TAX, Jurisdiction, SalesTaxTable, normalize_state, parse_zip)
+from custom_oscar_apps.partner.stockcache import get_cached_stockrecords, set_cached_stockrecords
+from custom_oscar_apps.partner.strategy import CellAgain
+
+
+def make_table():
+    return SalesTaxTable(
+        {'tx': Jurisdiction('tx', '', D('0.0625')), 'ca': Jurisdiction('ca', '', D('0.0725'))},
+        [(75201, 75398, Jurisdiction('tx', 'Dallas', D('0.0825'))),
+         (90001, 90899, Jurisdiction('ca', 'Los Angeles', D('0.095')))])
+
+
+class SalesTaxTableTest(SimpleTestCase):
+
+    def test_normalize_state(self):
+        self.assertEqual(normalize_state(' Texas '), 'tx')
+        self.assertEqual(normalize_state('TX'), 'tx')
+        self.assertEqual(normalize_state('new  york'), 'ny')
+        self.assertEqual(normalize_state('D.C.'), 'dc')
+        self.assertEqual(normalize_state(None), '')
+
+    def test_parse_zip(self):
+        self.assertEqual(parse_zip('75201-1234'), 75201)
+        self.assertEqual(parse_zip(' 02115'), 2115)
+        self.assertIsNone(parse_zip('SW1A 1AA'))
+        self.assertIsNone(parse_zip(None))
+
+    def test_zip_range_wins_over_state(self):
+        table = make_table()
+        self.assertEqual(table.lookup('Texas', '75201').county, 'Dallas')
+        self.assertEqual(table.lookup('tx', '75398-0001').rate, D('0.0825'))
+        self.assertEqual(table.lookup('tx', '75001').rate, D('0.0625'))
+        self.assertEqual(table.lookup('tx', '').rate, D('0.0625'))
+
+    def test_zip_range_only_within_its_state(self):
+        table = make_table()
+        self.assertEqual(table.lookup('Oklahoma', '75201'), NO_TAX)
+        self.assertEqual(table.lookup('California', '75201').rate, D('0.0725'))
+
+    def test_lookups_are_memoized(self):
+        table = make_table()
+        jurisdiction = table.lookup('Texas', '75201')
+        self.assertIs(table.lookup('TX', '75201-9999'), jurisdiction)
+        self.assertEqual(len(table._lookups), 1)
+
+    def test_overlapping_ranges(self):
+        dallas = Jurisdiction('tx', 'Dallas', D('0.0825'))
+        with self.assertRaises(ImproperlyConfigured):
+            SalesTaxTable({}, [(75201, 75398, dallas), (75300, 75400, dallas)])
+        # ranges of different states never meet.
+        SalesTaxTable({}, [(75201, 75398, dallas), (75300, 75400, Jurisdiction('ok', '', D('0.045')))])
+
+
+class PurchaseInfoMemoTest(SimpleTestCase):
+
+    def test_callers_get_their_own_price(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        strategy = CellAgain(request)
+        fetched = []
+
+        def fetch():
+            fetched.append(1)
+            return PurchaseInfo(FixedPrice('USD', D('10.00')), Available(), None)
+
+        first = strategy._memoized((1, None), fetch)
+        first.price.tax = D('0.83')
+        second = strategy._memoized((1, None), fetch)
+        self.assertEqual(len(fetched), 1)
+        self.assertFalse(second.price.is_tax_known)
+        self.assertEqual(second.price.excl_tax, D('10.00'))
+
+
+@override_settings(
+    CACHES={'stock': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PARTNER_STOCK_CACHE='stock')
+class StockCacheTest(SimpleTestCase):
+
+    def test_round_trip(self):
+        StockRecord = get_model('partner', 'StockRecord')
+        set_cached_stockrecords({
+            7: StockRecord(
+                id=5, product_id=7, partner_id=2, partner_sku='SKU7', price_currency='USD',
+                price_excl_tax=D('9.99'), num_in_stock=10, num_allocated=3),
+            8: None})
+        stockrecords = get_cached_stockrecords([7, 8, 9])
+        self.assertEqual(sorted(stockrecords), [7, 8])
+        self.assertIsNone(stockrecords[8])
+        stockrecord = stockrecords[7]
+        self.assertEqual((stockrecord.pk, stockrecord.product_id, stockrecord.partner_id), (5, 7, 2))
+        self.assertEqual((stockrecord.price_currency, stockrecord.price_excl_tax), ('USD', D('9.99')))
+        self.assertEqual(stockrecord.net_stock_level, 7)
+        self.assertIn('partner_sku', stockrecord.get_deferred_fields())
@@ -3,6 +3,8 @@ from django.conf import settings
 from django.utils.translation import ugettext_lazy as _
 from oscar.core import prices
 
+from custom_oscar_apps.checkout.money import Money
+
 
 class Base(object):
     code = ''
@@ -44,7 +46,7 @@ class Card(Base):
             currency=order.currency,
             excl_tax=D('0.00'),
             # we insist a tax percentage on order total.
-            tax=(order.total_excl_tax * self.rate).quantize(D('0.01'))
+            tax=Money.from_amount(order.total_excl_tax).scale(self.rate).amount
         )
 
 CARD_PAYMENT = Card().code
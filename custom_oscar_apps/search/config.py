@@ -3,3 +3,6 @@ from oscar.apps.search import config
 
 class SearchConfig(config.SearchConfig):
     name = 'custom_oscar_apps.search'
+
+    def ready(self):
+        from custom_oscar_apps.search import receivers  # noqa
@@ -1,4 +1,8 @@
+from collections import namedtuple
+
 from django import forms
+from django.http import QueryDict
+from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 from oscar.core.loading import get_model, get_class
 
@@ -6,30 +10,86 @@ Product = get_model('catalogue',  'product')
 is_solr_supported = get_class('search.features', 'is_solr_supported')
 
 if not is_solr_supported():
-    get_price_range_tuple = get_class('search.utils', 'get_price_range_tuple')
+    get_price_ranges = get_class('search.utils', 'get_price_ranges')
+    get_facet_choices = get_class('search.utils', 'get_facet_choices')
+
+    PriceRange = namedtuple('PriceRange', ['min_price', 'max_price', 'label', 'query', 'selected'])
 
     class SearchForm(forms.Form):
         def __init__(self, *args, **kwargs):
             super(SearchForm, self).__init__(*args, **kwargs)
 
-            grades = []
-            carriers = []
-            for p in Product.browsable.all():
-                grade_attrs = p.attribute_values.filter(attribute__code__exact='grade')
-                carrier_attrs = p.attribute_values.filter(attribute__code__exact='carrier')
-                grades.extend(grade_attrs)
-                carriers.extend(carrier_attrs)
-
-            self.fields['grade'].choices = list(
-                set(
-                    [(g.value, g.value) for g in sorted(grades, key=lambda x: x.value.lower())]
-                )
-            )
-            self.fields['carrier'].choices = list(
-                set(
-                    [(c.value, c.value) for c in sorted(carriers, key=lambda y: y.value.lower())]
-                )
-            )
+            # cached vocabulary, not a query per product.
+            facet_choices = get_facet_choices()
+            self.fields['grade'].choices = [(g, g) for g in facet_choices['grade']]
+            self.fields['carrier'].choices = [(c, c) for c in facet_choices['carrier']]
+            self.price_counts = None
+
+        @cached_property
+        def price_ranges(self):
+            """
+            The PriceRanges of the cached price buckets, listed by the
+            search form partial as links to the search on each of them.
+            """
+            ranges = []
+            for min_price, max_price in get_price_ranges():
+                label = self.get_price_range_label(min_price, max_price)
+                if self.price_counts is not None:
+                    label = '%s (%d)' % (label, self.price_counts.get((min_price, max_price), 0))
+                ranges.append(PriceRange(
+                    min_price, max_price, label,
+                    self.get_price_range_query(min_price, max_price),
+                    self.is_price_range_selected(min_price, max_price)))
+            return ranges
+
+        @property
+        def any_price_query(self):
+            return self.get_price_range_query(None, None)
+
+        def get_price_range_query(self, min_price, max_price):
+            # the current search on another price range, from its first page.
+            if isinstance(self.data, QueryDict):
+                query = self.data.copy()
+            else:
+                query = QueryDict('', mutable=True)
+            query.pop('page', None)
+            for name, value in (('min_price', min_price), ('max_price', max_price)):
+                if value is None:
+                    query.pop(name, None)
+                else:
+                    query[name] = value
+            return query.urlencode()
+
+        def is_price_range_selected(self, min_price, max_price):
+            return (
+                (self.data.get('min_price') or None) == (str(min_price) if min_price is not None else None) and
+                (self.data.get('max_price') or None) == (str(max_price) if max_price is not None else None))
+
+        def get_price_range_label(self, min_price, max_price):
+            if min_price is None and max_price is None:
+                return _('Any price')
+            if min_price is None:
+                return _('Under %s') % max_price
+            if max_price is None:
+                return _('%s and over') % min_price
+            return _('%(min)s to %(max)s') % {'min': min_price, 'max': max_price}
+
+        def set_facet_counts(self, facet_counts):
+            """
+            Show the number of matching products next to each grade,
+            carrier and price range, eg. "A (123)".
+            """
+            for code in ('grade', 'carrier'):
+                counts = dict(facet_counts.get(code, ()))
+                self.fields[code].choices = [
+                    (value, '%s (%d)' % (value, counts.get(value, 0)))
+                    for value, label in self.fields[code].choices]
+            if 'price' in facet_counts:
+                self.price_counts = dict(
+                    ((min_price, max_price), count)
+                    for min_price, max_price, count in facet_counts['price'])
+                # labelled again if read already.
+                self.__dict__.pop('price_ranges', None)
 
         q = forms.CharField(
             required=False, label=_('Search'),
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from oscar.core.loading import get_class, get_model
+
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+invalidate_facet_choices = get_class('search.utils', 'invalidate_facet_choices')
+
+
+@receiver(post_save, sender=ProductAttributeValue)
+@receiver(post_delete, sender=ProductAttributeValue)
+def invalidate_facet_choices_on_attribute_change(sender, instance, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    invalidate_facet_choices()
@@ -2,16 +2,52 @@ from haystack import indexes
 from oscar.apps.search import search_indexes
 
 
+class PrefetchedProduct(object):
+    """
+    A product whose has_stockrecords reads the prefetched stock records,
+    product.has_stockrecords queries even when they are prefetched.
+    """
+
+    def __init__(self, product):
+        self._product = product
+
+    def __getattr__(self, name):
+        return getattr(self._product, name)
+
+    @property
+    def has_stockrecords(self):
+        return len(self._product.stockrecords.all()) > 0
+
+
 class ProductIndex(search_indexes.ProductIndex):
     grading = indexes.CharField(null=True, faceted=True)
     carrier = indexes.CharField(null=True, faceted=True)
 
+    def index_queryset(self, using=None):
+        # everything the prepare methods read, fetched per batch of
+        # products instead of per product.
+        return super(ProductIndex, self).index_queryset(using).select_related(
+            'product_class'
+        ).prefetch_related(
+            'categories', 'stockrecords', 'children__stockrecords',
+            'attribute_values__attribute')
+
+    def get_attribute_values(self, obj, code):
+        # filtered in python to use the prefetched values.
+        values = [
+            attr.value_text for attr in obj.attribute_values.all()
+            if attr.attribute.code == code]
+        if len(values) > 0:
+            return values
+
     def prepare_grading(self, obj):
-        attrs = obj.attribute_values.filter(attribute__code__exact='grading')
-        if len(attrs) > 0:
-            return [attr.value_text for attr in attrs]
+        return self.get_attribute_values(obj, 'grading')
 
     def prepare_carrier(self, obj):
-        attrs = obj.attribute_values.filter(attribute__code__exact='carrier')
-        if len(attrs) > 0:
-            return [attr.value_text for attr in attrs]
+        return self.get_attribute_values(obj, 'carrier')
+
+    def prepare_price(self, obj):
+        return super(ProductIndex, self).prepare_price(PrefetchedProduct(obj))
+
+    def prepare_num_in_stock(self, obj):
+        return super(ProductIndex, self).prepare_num_in_stock(PrefetchedProduct(obj))
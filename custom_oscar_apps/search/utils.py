@@ -1,2 +1,57 @@
-def get_price_range_tuple(start=500, step=500, end=50000):
-    return list(zip(xrange(start, (end + step), step), xrange(start, (end + step), step)))
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from oscar.core.loading import get_model
+
+from casearch.pricebuckets import get_price_boundaries
+
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+
+# attribute codes the search form offers as filters.
+FACET_ATTRIBUTE_CODES = ('grade', 'carrier')
+FACET_CHOICES_CACHE_KEY = 'search.facet_choices'
+
+
+def get_price_ranges():
+    """
+    Return the (min_price, max_price) of the price buckets, None when open
+    ended. They follow the actual prices and are cached, see
+    casearch.pricebuckets.
+    """
+    bounds = [None] + list(get_price_boundaries()) + [None]
+    return list(zip(bounds, bounds[1:]))
+
+
+def get_facet_choices():
+    """
+    Return a dict of attribute code to the sorted distinct values the
+    browsable products have for it.
+
+    The vocabulary is read with one aggregate query and cached in the
+    shared cache until an attribute value changes.
+    """
+    choices = cache.get(FACET_CHOICES_CACHE_KEY)
+    if choices is None:
+        choices = dict((code, []) for code in FACET_ATTRIBUTE_CODES)
+        values = ProductAttributeValue.objects.filter(
+            attribute__code__in=FACET_ATTRIBUTE_CODES,
+            product__parent__isnull=True,
+        ).exclude(
+            value_text__isnull=True
+        ).exclude(
+            value_text=''
+        ).values_list('attribute__code', 'value_text').distinct()
+        for code, value in values:
+            choices[code].append(value)
+        for code in choices:
+            choices[code].sort(key=lambda v: v.lower())
+        cache.set(
+            FACET_CHOICES_CACHE_KEY, choices,
+            getattr(settings, 'SEARCH_FACET_CHOICES_CACHE_TIMEOUT', 60 * 60))
+    return choices
+
+
+def invalidate_facet_choices():
+    cache.delete(FACET_CHOICES_CACHE_KEY)
+    # again once committed, in case a read cached the values as they were.
+    transaction.on_commit(lambda: cache.delete(FACET_CHOICES_CACHE_KEY))
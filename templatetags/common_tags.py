@@ -6,3 +6,18 @@ register = template.Library()
 @register.simple_tag(name='subtract')
 def subtract(value, to_subtract):
     return int(round(value, 2) - round(to_subtract, 2))
+
+
+@register.simple_tag(name='get_parameters_except', takes_context=True)
+def get_parameters_except(context, *fields):
+    """
+    Like oscar's get_parameters, renders the current GET parameters
+    except for all the given ones.
+    """
+    getvars = context['request'].GET.copy()
+    for field in fields:
+        if field in getvars:
+            del getvars[field]
+    if len(getvars.keys()) > 0:
+        return '%s&' % getvars.urlencode()
+    return ''